@@ -0,0 +1,359 @@
+"""Microbenchmarks of the codec, datastore and update hot paths
+
+Run from the repository root:
+
+    python benchmarks/microbenchmarks.py                  # print timings
+    python benchmarks/microbenchmarks.py --save mybranch  # store a baseline
+    python benchmarks/microbenchmarks.py --compare main   # exit 1 on regressions
+
+Every benchmark reports the median time per call over ``--repeat`` runs,
+and the spread of the runs as noise. Baselines are JSON files in
+``benchmarks/baselines``.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymodbus.datastore import ModbusSequentialDataBlock
+from pymodbus.pdu.register_read_message import ReadHoldingRegistersResponse
+from modbus_benchmark import BENCHMARK_REGISTERS
+from modbus_changes import ChangeDetector
+from modbus_client import ModbusRTUClient
+from modbus_datablock import CompactDataBlock, SegmentedDataBlock
+from modbus_numpy_engine import np
+from modbus_read_planner import plan_reads
+from modbus_register_map import load_register_map
+from modbus_simulator import ModbusRTUSimulator
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import tempfile
+import timeit
+import yaml
+
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+SHIPPED_CONFIG = os.path.join(
+    os.path.dirname(BASELINE_DIR), "..", "modbus_register_configuration.yaml"
+)
+
+# Register map sizes as (buses, devices per bus); small is the shipped file
+SIZES = {
+    "small": None,
+    "medium": (1, 100),
+    "fleet": (10, 247),
+}
+
+# Registered benchmarks as (name, sizes, factory)
+BENCHMARKS = []
+
+
+def benchmark(*sizes):
+    """Register a factory that returns the callable to time at a size"""
+
+    def register(factory):
+        BENCHMARKS.append((factory.__name__, sizes or ("small",), factory))
+        return factory
+
+    return register
+
+
+def write_config(workdir, size):
+    """Write the register configuration of a size and return its path"""
+    if SIZES[size] is None:
+        path = os.path.join(workdir, "small.yaml")
+        shutil.copy(SHIPPED_CONFIG, path)
+        return path
+
+    buses, devices = SIZES[size]
+    config = {
+        "fleets": [
+            {
+                "device_ids": [1, devices],
+                "buses": [
+                    {"server_address": f"127.0.0.1:{20000 + bus}"} for bus in range(buses)
+                ],
+                "template": {"transport": "tcp", "registers": BENCHMARK_REGISTERS},
+            }
+        ]
+    }
+    path = os.path.join(workdir, f"{size}.yaml")
+    with open(path, "w") as f:
+        yaml.safe_dump(config, f)
+    return path
+
+
+def simulator(workdir, size, **options):
+    """Create a simulator for a size, its value updates are never started"""
+    return ModbusRTUSimulator(write_config(workdir, size), **options)
+
+
+def first_context(sim):
+    """Return the first device and its slave context"""
+    device = sim.register_map.devices[0]
+    return device, sim.device_context(device)
+
+
+@benchmark()
+def write_float(workdir, size):
+    sim = simulator(workdir, size)
+    _, context = first_context(sim)
+    return lambda: sim.write_float(context, 1000, 3.14)
+
+
+@benchmark()
+def write_string(workdir, size):
+    sim = simulator(workdir, size)
+    _, context = first_context(sim)
+    return lambda: sim.write_string(context, 100, "PROD123456", 20)
+
+
+class ContextClient:
+    """Stands in for a pymodbus client, answering reads from a slave context"""
+
+    def __init__(self, context):
+        self.context = context
+
+    def read_holding_registers(self, address, count=1, slave=1):
+        return ReadHoldingRegistersResponse(self.context.getValues(3, address, count))
+
+
+def client(workdir, size, device):
+    """Create a client whose requests are served by a simulated device"""
+    path = write_config(workdir, size)
+    modbus_client = ModbusRTUClient(path)
+    modbus_client.client = ContextClient(
+        ModbusRTUSimulator(path).device_context(device)
+    )
+    return modbus_client
+
+
+@benchmark()
+def read_float(workdir, size):
+    """ModbusRTUClient.read_float served by a simulated device, without I/O"""
+    device = simulator(workdir, size).register_map.devices[0]
+    modbus_client = client(workdir, size, device)
+    return lambda: modbus_client.read_float(device.device_id, 1000)
+
+
+@benchmark()
+def read_string(workdir, size):
+    """ModbusRTUClient.read_string of 20 bytes served by a simulated device"""
+    device = simulator(workdir, size).register_map.devices[-1]
+    modbus_client = client(workdir, size, device)
+    return lambda: modbus_client.read_string(device.device_id, 100, 20)
+
+
+@benchmark("small", "medium", "fleet")
+def update_sfp_values(workdir, size):
+    """One update tick of every device with the python engine"""
+    sim = simulator(workdir, size)
+    callbacks = [task.callback for tasks in sim.device_tasks.values() for task in tasks]
+
+    def tick():
+        for callback in callbacks:
+            callback()
+
+    return tick
+
+
+@benchmark("small", "medium", "fleet")
+def numpy_update(workdir, size):
+    """One update tick of every device with the numpy engine"""
+    if np is None:
+        return None
+    sim = simulator(workdir, size, engine="numpy")
+    engines = list(sim.sfp_engines.values())
+
+    def tick():
+        for sfp_engine in engines:
+            sfp_engine.update()
+
+    return tick
+
+
+@benchmark("small", "medium", "fleet")
+def compute_read(workdir, size):
+    """Reading the SFPs of every device with the compute engine"""
+    sim = simulator(workdir, size, engine="compute", sparse=True)
+    blocks = [
+        sim.device_context(device).store["h"]
+        for device in sim.register_map.devices
+        if "sfps" in device.groups
+    ]
+
+    def read_all():
+        for block in blocks:
+            # Every read lands in the next quantum and recomputes
+            block.start -= 1.0
+            block.getValues(1000, 6)
+
+    return read_all
+
+
+@benchmark()
+def detect_unchanged(workdir, size):
+    """Change detection of an SFP block that reads the same as last time"""
+    sim = simulator(workdir, size)
+    device, context = first_context(sim)
+    block = plan_reads(device.groups["sfps"], max_gap=8)[0]
+    registers = context.getValues(3, block.address, block.count)
+    detector = ChangeDetector()
+    detector.changes(device, block, registers)
+    return lambda: detector.changes(device, block, registers)
+
+
+@benchmark()
+def sequential_datablock(workdir, size):
+    """pymodbus ModbusSequentialDataBlock setValues and getValues"""
+    block = ModbusSequentialDataBlock(0, [0] * 65536)
+    return lambda: (block.setValues(1000, [1, 2, 3, 4]), block.getValues(1000, 4))
+
+
+@benchmark()
+def compact_datablock(workdir, size):
+    """CompactDataBlock setValues and getValues"""
+    block = CompactDataBlock(0, 65536)
+    return lambda: (block.setValues(1000, [1, 2, 3, 4]), block.getValues(1000, 4))
+
+
+@benchmark()
+def segmented_datablock(workdir, size):
+    """SegmentedDataBlock setValues and getValues"""
+    block = SegmentedDataBlock([(1000, 6), (2000, 6), (3000, 6), (4000, 6)])
+    return lambda: (block.setValues(1000, [1, 2, 3, 4]), block.getValues(1000, 4))
+
+
+@benchmark("small", "medium", "fleet")
+def yaml_load(workdir, size):
+    """Parsing and compiling the register map without the cache"""
+    path = write_config(workdir, size)
+    return lambda: load_register_map(path, cache_dir=None)
+
+
+@benchmark("small", "medium", "fleet")
+def yaml_load_cached(workdir, size):
+    """Loading the compiled register map from the cache"""
+    path = write_config(workdir, size)
+    cache_dir = os.path.join(workdir, "cache")
+    load_register_map(path, cache_dir)
+    return lambda: load_register_map(path, cache_dir)
+
+
+def run(names=None, sizes=None, repeat=15):
+    """Time the selected benchmarks
+
+    Returns the median seconds per call by name, and the noise by name: the
+    interquartile range of the runs relative to their median.
+    """
+    results = {}
+    noise = {}
+    workdir = tempfile.mkdtemp(prefix="modbus_microbenchmarks_")
+    try:
+        for name, benchmark_sizes, factory in BENCHMARKS:
+            if names and not any(selected in name for selected in names):
+                continue
+            for size in benchmark_sizes:
+                if sizes and size not in sizes:
+                    continue
+                function = factory(workdir, size)
+                if function is None:
+                    print(f"{name}[{size}]: skipped", file=sys.stderr)
+                    continue
+
+                timer = timeit.Timer(function)
+                number, _ = timer.autorange()
+                times = [seconds / number for seconds in timer.repeat(repeat, number)]
+                median = statistics.median(times)
+                quartiles = statistics.quantiles(times, n=4)
+                results[f"{name}[{size}]"] = median
+                noise[f"{name}[{size}]"] = (quartiles[2] - quartiles[0]) / median
+                print(
+                    f"{name}[{size}]: {median * 1e6:.2f} us "
+                    f"±{noise[f'{name}[{size}]']:.1%}",
+                    file=sys.stderr,
+                )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results, noise
+
+
+def baseline_path(name):
+    """Path of a stored baseline"""
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def compare(results, baseline, threshold, noise=None, baseline_noise=None):
+    """Print the change against a baseline and return the regressions
+
+    A benchmark only regressed when it got slower by more than ``threshold``
+    plus the noise of both the current and the baseline runs.
+    """
+    noise = noise or {}
+    baseline_noise = baseline_noise or {}
+    regressions = []
+    print(f"{'benchmark':40} {'baseline':>12} {'current':>12} {'change':>8} {'limit':>8}")
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:40} {'-':>12} {seconds * 1e6:>10.2f}us {'new':>8}")
+            continue
+        change = seconds / before - 1
+        limit = threshold + noise.get(name, 0.0) + baseline_noise.get(name, 0.0)
+        flag = " !" if change > limit else ""
+        print(
+            f"{name:40} {before * 1e6:>10.2f}us {seconds * 1e6:>10.2f}us "
+            f"{change:>+7.1%} {limit:>7.1%}{flag}"
+        )
+        if change > limit:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Modbus simulator microbenchmarks")
+    parser.add_argument("--filter", nargs="*", help="only run benchmarks containing these")
+    parser.add_argument("--sizes", nargs="*", choices=list(SIZES), help="register map sizes")
+    parser.add_argument("--repeat", type=int, default=15, help="timing runs per benchmark")
+    parser.add_argument("--save", metavar="NAME", help="store the results as a baseline")
+    parser.add_argument("--compare", metavar="NAME", help="compare with a stored baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="slowdown beyond the noise counted as a regression, 0.10 is 10%%",
+    )
+    args = parser.parse_args()
+
+    results, noise = run(args.filter, args.sizes, args.repeat)
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path(args.save), "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "results": results,
+                    "noise": noise,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+            f.write("\n")
+
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            baseline = json.load(f)
+        if compare(
+            results, baseline["results"], args.threshold, noise, baseline.get("noise")
+        ):
+            sys.exit(1)
+    elif not args.save:
+        json.dump(results, sys.stdout, indent=2)
+        print()
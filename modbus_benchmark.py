@@ -0,0 +1,405 @@
+import logging
+from pymodbus.client import AsyncModbusSerialClient, AsyncModbusTcpClient, AsyncModbusUdpClient
+from pymodbus.exceptions import ModbusException
+from pymodbus.framer import FramerType
+from modbus_logging import setup_logging
+from modbus_register_map import load_register_map
+from modbus_simulator import ModbusRTUSimulator
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import yaml
+
+
+log = logging.getLogger(__name__)
+
+# Request mix used when --mix is not given, in percent
+DEFAULT_MIX = {"fc3": 70, "fc4": 10, "fc6": 10, "fc16": 10}
+
+# Registers of every generated benchmark device, like the boards in the
+# shipped configuration
+BENCHMARK_REGISTERS = {
+    "sfps": [
+        {
+            "sfp": sfp,
+            "rx_power": {"address": sfp * 1000, "datatype": "float32"},
+            "tx_power": {"address": sfp * 1000 + 2, "datatype": "float32"},
+            "temperature": {"address": sfp * 1000 + 4, "datatype": "float32"},
+        }
+        for sfp in range(1, 5)
+    ],
+    "product_info": {
+        "product_number": {"address": 100, "datatype": "string", "length": 20},
+        "serial_number": {"address": 110, "datatype": "string", "length": 20},
+    },
+}
+
+
+def parse_mix(text):
+    """Parse a request mix like "fc3=70,fc16=30" into weights"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip().lower()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unsupported function {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def free_port():
+    """Return a loopback TCP port that is currently unused"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(latencies, fraction):
+    """Nearest-rank percentile of sorted latencies"""
+    if not latencies:
+        return None
+    index = min(len(latencies) - 1, max(0, int(fraction * len(latencies) + 0.5) - 1))
+    return latencies[index]
+
+
+def summarize(latencies, duration):
+    """Throughput and latency percentiles in milliseconds"""
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "throughput": round(len(latencies) / duration, 1),
+        "latency_ms": {
+            name: None if value is None else round(value * 1000, 3)
+            for name, value in (
+                ("mean", sum(latencies) / len(latencies) if latencies else None),
+                ("p50", percentile(latencies, 0.5)),
+                ("p99", percentile(latencies, 0.99)),
+                ("p999", percentile(latencies, 0.999)),
+                ("max", latencies[-1] if latencies else None),
+            )
+        },
+    }
+
+
+class LoadTest:
+    """Drive a simulator with concurrent async clients and measure latency
+
+    The simulator runs in a child process so the clients do not share its
+    event loop or GIL. Without a configuration file a fleet of identical
+    boards is generated on loopback sockets, or on socat PTY pairs for the
+    ``pty`` transport. A serial bus has a single master, so it gets at most
+    one of the clients.
+    """
+
+    def __init__(
+        self,
+        config_file=None,
+        transport="tcp",
+        devices=10,
+        buses=1,
+        clients=8,
+        mix=None,
+        simulator_options=None,
+    ):
+        self.transport = transport
+        self.clients = clients
+        self.mix = mix or DEFAULT_MIX
+        self.simulator_options = simulator_options or {}
+        self.workdir = tempfile.mkdtemp(prefix="modbus_benchmark_")
+        self.socat = []
+
+        try:
+            if config_file is None:
+                config_file = self._generate_config(devices, buses)
+            self.config_file = config_file
+            self.register_map = load_register_map(config_file)
+        except BaseException:
+            self._cleanup()
+            raise
+
+        self.buses = {}
+        for device in self.register_map.devices:
+            self.buses.setdefault(device.bus, []).append(device)
+        self.client_buses = self._client_buses()
+
+    def _client_buses(self):
+        """Return the bus of every client, at most one per serial bus
+
+        Clients sharing a PTY would read each other's responses.
+        """
+        buses = list(self.buses)
+        client_buses = []
+        for index in range(self.clients):
+            bus = buses[index % len(buses)]
+            if bus[0] == "rtu" and bus in client_buses:
+                continue
+            client_buses.append(bus)
+        if len(client_buses) < self.clients:
+            log.warning(
+                "Running %d clients, one per serial bus instead of %d",
+                len(client_buses),
+                self.clients,
+            )
+        return client_buses
+
+    def _cleanup(self):
+        """Stop the socat processes and remove the working directory"""
+        for process in self.socat:
+            process.terminate()
+            process.wait()
+        self.socat = []
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _generate_config(self, devices, buses):
+        """Write a fleet configuration for the benchmark and return its path"""
+        if not 1 <= devices <= 247:
+            raise ValueError("devices must be between 1 and 247 per bus")
+
+        template = {
+            "description": "Benchmark board {device_id}",
+            "registers": BENCHMARK_REGISTERS,
+        }
+        bus_entries = []
+        for bus in range(buses):
+            if self.transport == "pty":
+                server_port, com_port = self._pty_pair(bus)
+                bus_entries.append(
+                    {"com_port": com_port, "server_port": server_port, "baudrate": 115200}
+                )
+            else:
+                template["transport"] = self.transport
+                bus_entries.append({"server_address": f"127.0.0.1:{free_port()}"})
+
+        config = {
+            "fleets": [
+                {"device_ids": [1, devices], "buses": bus_entries, "template": template}
+            ]
+        }
+        path = os.path.join(self.workdir, "benchmark.yaml")
+        with open(path, "w") as f:
+            yaml.safe_dump(config, f)
+        return path
+
+    def _pty_pair(self, bus):
+        """Create a socat PTY pair and return its two device paths"""
+        if shutil.which("socat") is None:
+            raise RuntimeError("the pty transport needs socat")
+        server_port = os.path.join(self.workdir, f"server{bus}")
+        com_port = os.path.join(self.workdir, f"client{bus}")
+        self.socat.append(
+            subprocess.Popen(
+                [
+                    "socat",
+                    f"pty,raw,echo=0,link={server_port}",
+                    f"pty,raw,echo=0,link={com_port}",
+                ]
+            )
+        )
+        deadline = time.monotonic() + 5
+        while not (os.path.exists(server_port) and os.path.exists(com_port)):
+            if time.monotonic() > deadline:
+                raise RuntimeError("socat did not create the PTY pair")
+            time.sleep(0.05)
+        return server_port, com_port
+
+    @staticmethod
+    def _serve(config_file, options):
+        """Run the simulator, in the child process"""
+        setup_logging(logging.WARNING)
+        ModbusRTUSimulator(config_file, **options).start_server(use_asyncio=True)
+
+    def _create_client(self, bus):
+        """Create a pymodbus async client for a bus"""
+        transport, target = bus
+        if transport == "rtu":
+            baudrate = self.buses[bus][0].baudrate
+            return AsyncModbusSerialClient(port=target, baudrate=baudrate, timeout=1)
+        host, port = target
+        if transport == "udp":
+            return AsyncModbusUdpClient(host, port=port, timeout=1)
+        if transport == "rtu_over_tcp":
+            return AsyncModbusTcpClient(host, port=port, framer=FramerType.RTU, timeout=1)
+        return AsyncModbusTcpClient(host, port=port, timeout=1)
+
+    async def _connect(self, bus, timeout=10.0):
+        """Connect a client, waiting for the simulator to start listening"""
+        deadline = time.monotonic() + timeout
+        while True:
+            client = self._create_client(bus)
+            if await client.connect():
+                return client
+            client.close()
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"could not connect to {bus[1]}")
+            await asyncio.sleep(0.2)
+
+    @staticmethod
+    def _request(client, function, device, register_field, rng):
+        """Start one request of the mix against a field of a device"""
+        slave = device.device_id
+        if function == "fc3":
+            return client.read_holding_registers(
+                register_field.address, count=register_field.count, slave=slave
+            )
+        if function == "fc4":
+            return client.read_input_registers(
+                register_field.address, count=register_field.count, slave=slave
+            )
+        if function == "fc6":
+            return client.write_register(
+                register_field.address, rng.randrange(65536), slave=slave
+            )
+        return client.write_registers(
+            register_field.address,
+            [rng.randrange(65536) for _ in range(register_field.count)],
+            slave=slave,
+        )
+
+    async def _worker(self, client, devices, stop, warmup_end, results, seed):
+        """Issue requests back to back until stop and record their latency"""
+        rng = random.Random(seed)
+        functions = list(self.mix)
+        weights = [self.mix[function] for function in functions]
+
+        while time.monotonic() < stop:
+            function = rng.choices(functions, weights)[0]
+            device = rng.choice(devices)
+            register_field = rng.choice(device.fields)
+
+            start = time.perf_counter()
+            try:
+                response = await self._request(
+                    client, function, device, register_field, rng
+                )
+                failed = response.isError()
+            except ModbusException:
+                failed = True
+            latency = time.perf_counter() - start
+
+            if time.monotonic() < warmup_end:
+                continue
+            if failed:
+                results["errors"][function] = results["errors"].get(function, 0) + 1
+            else:
+                results["latencies"].setdefault(function, []).append(latency)
+
+    async def _drive(self, duration, warmup):
+        """Connect the clients and run them for warmup plus duration seconds"""
+        clients = [await self._connect(bus) for bus in self.client_buses]
+        results = {"latencies": {}, "errors": {}}
+
+        warmup_end = time.monotonic() + warmup
+        stop = warmup_end + duration
+        try:
+            await asyncio.gather(
+                *(
+                    self._worker(client, self.buses[bus], stop, warmup_end, results, i)
+                    for i, (client, bus) in enumerate(zip(clients, self.client_buses))
+                )
+            )
+        finally:
+            for client in clients:
+                client.close()
+        return results
+
+    def run(self, duration=10.0, warmup=1.0):
+        """Run the load test and return the report"""
+        server = multiprocessing.Process(
+            target=self._serve,
+            args=(self.config_file, self.simulator_options),
+            daemon=True,
+        )
+        server.start()
+        try:
+            results = asyncio.run(self._drive(duration, warmup))
+        finally:
+            server.terminate()
+            server.join()
+            self._cleanup()
+
+        all_latencies = [
+            latency for latencies in results["latencies"].values() for latency in latencies
+        ]
+        return {
+            "transport": self.transport,
+            "devices": len(self.register_map.devices),
+            "buses": len(self.buses),
+            "clients": len(self.client_buses),
+            "duration": duration,
+            "mix": self.mix,
+            "simulator": self.simulator_options,
+            **summarize(all_latencies, duration),
+            "errors": sum(results["errors"].values()),
+            "functions": {
+                function: {
+                    **summarize(results["latencies"].get(function, []), duration),
+                    "errors": results["errors"].get(function, 0),
+                }
+                for function in self.mix
+            },
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Modbus simulator load test")
+    parser.add_argument(
+        "--config",
+        help="serve this configuration instead of a generated fleet",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=("tcp", "rtu_over_tcp", "udp", "pty"),
+        default="tcp",
+        help="transport of the generated fleet, pty needs socat",
+    )
+    parser.add_argument("--devices", type=int, default=10, help="devices per bus")
+    parser.add_argument("--buses", type=int, default=1, help="buses of the fleet")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients")
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="request mix in percent, like fc3=70,fc4=10,fc6=10,fc16=10",
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to measure")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds to discard")
+    parser.add_argument(
+        "--engine",
+        choices=("python", "numpy", "compute"),
+        default="python",
+        help="simulator engine",
+    )
+    parser.add_argument("--sparse", action="store_true", help="use sparse datablocks")
+    parser.add_argument("--lazy", action="store_true", help="create devices lazily")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+    setup_logging(logging.WARNING)
+
+    options = {"engine": args.engine, "sparse": args.sparse, "lazy": args.lazy}
+    if args.sparse and "fc4" in args.mix:
+        print("Sparse devices have no input registers, fc4 requests will fail", file=sys.stderr)
+
+    report = LoadTest(
+        args.config,
+        transport=args.transport,
+        devices=args.devices,
+        buses=args.buses,
+        clients=args.clients,
+        mix=args.mix,
+        simulator_options=options,
+    ).run(args.duration, args.warmup)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
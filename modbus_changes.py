@@ -0,0 +1,48 @@
+from array import array
+
+
+class ChangeDetector:
+    """Report only the values that changed since the previous poll
+
+    Keeps the raw registers of every block and field that was read. A block
+    whose registers are byte for byte the same as last time is skipped
+    without decoding anything. Otherwise only the fields whose registers
+    changed are decoded, and fields with a deadband are only reported once
+    they moved more than the deadband away from the value reported last.
+    The first read of every field is reported.
+    """
+
+    def __init__(self):
+        # Raw bytes of every block and field, keyed by device and address
+        self._blocks = {}
+        self._fields = {}
+        # Last value reported per field with a deadband
+        self._reported = {}
+
+    def changes(self, device, block, registers):
+        """Return the decoded fields of a block read that should be reported"""
+        device_key = (device.bus, device.device_id)
+        data = array("H", registers).tobytes()
+        block_key = (device_key, block.address, block.count)
+        if self._blocks.get(block_key) == data:
+            return {}
+        self._blocks[block_key] = data
+
+        changed = {}
+        for register_field in block.fields:
+            start = (register_field.address - block.address) * 2
+            raw = data[start : start + register_field.count * 2]
+            field_key = (device_key, register_field.key)
+            if self._fields.get(field_key) == raw:
+                continue
+            self._fields[field_key] = raw
+
+            value = register_field.codec.decode(block.slice(registers, register_field))
+            deadband = device.deadband.get(register_field.name)
+            if deadband is not None:
+                reported = self._reported.get(field_key)
+                if reported is not None and abs(value - reported) <= deadband:
+                    continue
+                self._reported[field_key] = value
+            changed[register_field.key] = value
+        return changed
@@ -1,22 +1,223 @@
 import logging
-from pymodbus.client import ModbusSerialClient
-from pymodbus.payload import BinaryPayloadDecoder
-from pymodbus.constants import Endian
-import yaml
+from pymodbus.client import (
+    AsyncModbusSerialClient,
+    AsyncModbusTcpClient,
+    AsyncModbusUdpClient,
+    ModbusSerialClient,
+)
+from pymodbus.exceptions import ModbusException, ModbusIOException
+from pymodbus.framer import FramerRTU, FramerType
+from pymodbus.pdu import ExceptionResponse, ModbusExceptions
+from modbus_changes import ChangeDetector
+from modbus_codec import FLOAT32, get_codec
+from modbus_logging import add_logging_arguments, setup_logging_from_args
+from modbus_metrics import MetricsRegistry, endpoint_label, start_http_server
+from modbus_read_planner import plan_reads, split_block
+from modbus_register_map import load_register_map
+from modbus_scheduler import PollScheduler
+from modbus_trace import TraceRecorder
+import argparse
+import asyncio
 import time
 
 
-# Configure logging
-logging.basicConfig()
-log = logging.getLogger()
-log.setLevel(logging.INFO)
+log = logging.getLogger(__name__)
 
 
-class ModbusRTUClient:
-    def __init__(self, config_file):
-        # Load configuration
-        with open(config_file, "r") as f:
-            self.config = yaml.safe_load(f)
+class DroppedFrameMonitor:
+    """Notice responses an RTU framer drops
+
+    pymodbus skips bytes that fail the CRC check without reporting them, the
+    request then times out. This wraps the framer's ``decode`` and flags
+    every call that discarded bytes in front of, or instead of, a frame.
+    """
+
+    def __init__(self, framer):
+        self.dropped = False
+        self._decode = framer.decode
+        framer.decode = self.decode
+
+    def decode(self, data):
+        """Decode like the framer, flagging discarded bytes"""
+        used_len, dev_id, tid, frame = self._decode(data)
+        # An RTU frame is the slave id, the PDU and two CRC bytes
+        skipped = used_len - len(frame) - 3 if frame else used_len
+        if skipped > 0:
+            self.dropped = True
+        return used_len, dev_id, tid, frame
+
+    def take(self):
+        """Return whether bytes were dropped since the last call"""
+        dropped, self.dropped = self.dropped, False
+        return dropped
+
+
+def timed_out(response):
+    """Check if a request got no response
+
+    The sync client returns a ModbusIOException, the async client an
+    ExceptionResponse without an exception code.
+    """
+    if isinstance(response, ModbusIOException):
+        return True
+    return isinstance(response, ExceptionResponse) and not response.exception_code
+
+
+def illegal_address(response):
+    """Check if a device rejected a request for registers it does not have"""
+    return (
+        isinstance(response, ExceptionResponse)
+        and response.exception_code == ModbusExceptions.IllegalAddress
+    )
+
+
+class ClientMetrics:
+    """Round trip times, timeouts, CRC errors and poll cycles per bus"""
+
+    def __init__(self, registry):
+        self.round_trip = registry.histogram(
+            "modbus_client_round_trip_seconds",
+            "Time from sending a request to receiving its response",
+            ("bus",),
+        )
+        self.timeouts = registry.counter(
+            "modbus_client_timeouts_total",
+            "Requests that got no response",
+            ("bus",),
+        )
+        self.crc_errors = registry.counter(
+            "modbus_client_crc_errors_total",
+            "Requests whose response was dropped for a bad CRC",
+            ("bus",),
+        )
+        self.poll_cycle = registry.histogram(
+            "modbus_client_poll_cycle_seconds",
+            "Time to read the due registers of every device on a bus",
+            ("bus",),
+        )
+        self._monitors = {}
+        self._labels = {}
+
+    def label(self, bus):
+        """Label value of a bus"""
+        if bus not in self._labels:
+            self._labels[bus] = endpoint_label(bus)
+        return self._labels[bus]
+
+    def watch_framer(self, framer, *buses):
+        """Count the responses an RTU framer serving some buses drops"""
+        if isinstance(framer, FramerRTU):
+            monitor = DroppedFrameMonitor(framer)
+            for bus in buses:
+                self._monitors[bus] = monitor
+
+    def request(self, bus, started, response):
+        """Record a request sent at ``perf_counter()`` time ``started``"""
+        label = self.label(bus)
+        monitor = self._monitors.get(bus)
+        if monitor is not None and monitor.take():
+            self.crc_errors.inc(label)
+        if response is None or timed_out(response):
+            self.timeouts.inc(label)
+        else:
+            self.round_trip.observe(time.perf_counter() - started, label)
+
+
+class _PollingClient:
+    """Read plans and response handling shared by the sync and async clients
+
+    Subclasses only differ in how a block is sent, see ``_read``.
+    """
+
+    def __init__(
+        self, config_file, max_gap=8, recorder=None, metrics=None, changes_only=False
+    ):
+        # Load and compile the register configuration
+        self.register_map = load_register_map(config_file)
+        self.max_gap = max_gap
+
+        # Optionally append every block read to a trace
+        self.recorder = recorder
+
+        # Optionally only decode and report the values that changed
+        self.detector = ChangeDetector() if changes_only else None
+        self.devices = {
+            (device.bus, device.device_id): device for device in self.register_map.devices
+        }
+
+        # Optionally time every request and poll cycle in a MetricsRegistry
+        self.metrics = ClientMetrics(metrics) if metrics is not None else None
+
+        # Group the devices by the bus they are polled on
+        self.buses = {}
+        for device in self.register_map.devices:
+            self.buses.setdefault(device.bus, []).append(device)
+
+        # Precompute the coalesced reads for every device
+        self.read_plans = {
+            (device.bus, device.device_id): plan_reads(device.fields, max_gap=max_gap)
+            for device in self.register_map.devices
+        }
+
+        # Smaller reads replacing the blocks a device rejected
+        self.split_plans = {}
+
+    def _split_parts(self, bus, device_id, block):
+        """Return the reads replacing a block the device rejected, or None"""
+        return self.split_plans.get((bus, device_id, block.address, block.count))
+
+    def _read_failed(self, bus, device_id, exc):
+        """Log a request that raised instead of returning a response"""
+        log.warning(
+            "Reading device %s on %s failed: %s",
+            device_id,
+            bus[1],
+            exc,
+            extra={"device_id": device_id, "bus": bus[1]},
+        )
+
+    def _decode_response(self, bus, device_id, block, response):
+        """Decode the response to a block read
+
+        Returns None when the device rejected the block with an illegal data
+        address exception: the block is split into smaller reads, which
+        replace it from then on. Failed reads decode to no values.
+        """
+        if response is None:
+            return {}
+        if response.isError():
+            if illegal_address(response) and len(block.fields) > 1:
+                log_split(device_id, block)
+                key = (bus, device_id, block.address, block.count)
+                self.split_plans[key] = split_block(block)
+                return None
+            return {}
+        if self.recorder is not None:
+            self.recorder.record(bus, device_id, block, response.registers)
+        if self.detector is not None:
+            return self.detector.changes(
+                self.devices[(bus, device_id)], block, response.registers
+            )
+        return block.decode(response.registers)
+
+
+class ModbusRTUClient(_PollingClient):
+    def __init__(
+        self, config_file, max_gap=8, recorder=None, metrics=None, changes_only=False
+    ):
+        super().__init__(config_file, max_gap, recorder, metrics, changes_only)
+
+        # Every bus is polled over the one serial port below
+        if len(self.buses) > 1:
+            log.warning(
+                "Polling the devices of %d buses over one serial port, "
+                "use --asyncio to poll every bus on its own connection",
+                len(self.buses),
+            )
+
+        # Poll every register group at its own period
+        self.due_plans = {}
+        self.poll_scheduler = self._create_poll_scheduler()
 
         # Create client
         self.client = ModbusSerialClient(
@@ -26,15 +227,14 @@ class ModbusRTUClient:
             stopbits=1,
             bytesize=8,
         )
+        if self.metrics is not None:
+            self.metrics.watch_framer(self.client.framer, *self.buses)
 
     def read_float(self, device_id, address):
         """Read a 32-bit float value from the specified address"""
         response = self.client.read_holding_registers(address, count=2, slave=device_id)
         if not response.isError():
-            decoder = BinaryPayloadDecoder.fromRegisters(
-                response.registers, byteorder=Endian.BIG, wordorder=Endian.BIG
-            )
-            return decoder.decode_32bit_float()
+            return FLOAT32.decode(response.registers)
         return None
 
     def read_string(self, device_id, address, length):
@@ -46,75 +246,371 @@ class ModbusRTUClient:
         )
 
         if not response.isError():
-            # Convert registers to bytes
-            bytes_list = []
-            for register in response.registers:
-                bytes_list.extend(register.to_bytes(2, byteorder="big"))
-
-            # Convert bytes to string and strip null characters
-            return bytes(bytes_list).decode("ascii").rstrip("\0")
+            return get_codec("string", length).decode(response.registers)
         return None
 
+    def _read(self, bus, device_id, block):
+        """Send a block read, returning its response or None if it raised"""
+        started = time.perf_counter()
+        try:
+            response = self.client.read_holding_registers(
+                block.address, count=block.count, slave=device_id
+            )
+        except ModbusException as exc:
+            self._read_failed(bus, device_id, exc)
+            response = None
+        if self.metrics is not None:
+            self.metrics.request(bus, started, response)
+        return response
+
+    def read_block(self, bus, device_id, block):
+        """Read a coalesced block and decode every field it covers
+
+        A block the device rejects with an illegal data address exception is
+        split into smaller reads, which replace it from then on.
+        """
+        parts = self._split_parts(bus, device_id, block)
+        if parts is None:
+            response = self._read(bus, device_id, block)
+            values = self._decode_response(bus, device_id, block, response)
+            if values is not None:
+                return values
+            parts = self._split_parts(bus, device_id, block)
+
+        values = {}
+        for part in parts:
+            values.update(self.read_block(bus, device_id, part))
+        return values
+
+    def read_device(self, bus, device_id):
+        """Read all configured fields of a device using the coalesced plan"""
+        values = {}
+        for block in self.read_plans.get((bus, device_id), []):
+            values.update(self.read_block(bus, device_id, block))
+        return values
+
     def read_all_values(self):
         """Read all configured values from the devices"""
-        for device in self.config["modbus_devices"]:
-            device_id = device["device_id"]
-            print(f"\nReading from Device {device_id} ({device['description']})")
-
-            if "registers" in device:
-                # Read SFP values
-                if "sfps" in device["registers"]:
-                    for sfp in device["registers"]["sfps"]:
-                        print(f"\nSFP {sfp['sfp']}:")
-                        rx_power = self.read_float(
-                            device_id, sfp["rx_power"]["address"]
-                        )
-                        tx_power = self.read_float(
-                            device_id, sfp["tx_power"]["address"]
-                        )
-                        temp = self.read_float(device_id, sfp["temperature"]["address"])
-
-                        print(f"{rx_power:.2f} dBm, {tx_power:.2f} dBm, {temp:.2f} °C")
-
-                # Read product info
-                if "product_info" in device["registers"]:
-                    product_info = device["registers"]["product_info"]
-                    print("\nProduct Info:")
-
-                    if "product_number" in product_info:
-                        product_number = self.read_string(
-                            device_id,
-                            product_info["product_number"]["address"],
-                            product_info["product_number"]["length"],
-                        )
-                        print(f"  Product Number: {product_number}")
-
-                    if "serial_number" in product_info:
-                        serial_number = self.read_string(
-                            device_id,
-                            product_info["serial_number"]["address"],
-                            product_info["serial_number"]["length"],
-                        )
-                        print(f"  Serial Number: {serial_number}")
+        for device in self.register_map.devices:
+            print_device_values(device, self.read_device(device.bus, device.device_id))
+
+    def _create_poll_scheduler(self):
+        """Schedule the reads of every register group"""
+        scheduler = PollScheduler()
+        for device in self.register_map.devices:
+            for group, timing in device.poll.items():
+                scheduler.add((device.bus, device.device_id, group), *timing)
+        return scheduler
+
+    def poll_due(self):
+        """Read the groups that are due, coalescing the reads of each device
+
+        Devices are read in the order of their most urgent due group. Returns
+        the decoded values per device and the groups that were read.
+        """
+        jobs = self.poll_scheduler.pop_due()
+        groups = {}
+        for job in jobs:
+            bus, device_id, group = job.key
+            groups.setdefault((bus, device_id), []).append(group)
+
+        results = []
+        cycle = {}
+        for (bus, device_id), due_groups in groups.items():
+            started = time.perf_counter()
+            device = self.devices[(bus, device_id)]
+            key = (bus, device_id, frozenset(due_groups))
+            if key not in self.due_plans:
+                fields = [
+                    register_field
+                    for group in due_groups
+                    for register_field in device.groups[group]
+                ]
+                self.due_plans[key] = plan_reads(fields, max_gap=self.max_gap)
+
+            values = {}
+            for block in self.due_plans[key]:
+                values.update(self.read_block(bus, device_id, block))
+            results.append((device, values, due_groups))
+            cycle[bus] = cycle.get(bus, 0.0) + time.perf_counter() - started
+
+        if self.metrics is not None:
+            for bus, duration in cycle.items():
+                self.metrics.poll_cycle.observe(duration, self.metrics.label(bus))
+
+        for job in jobs:
+            if self.poll_scheduler.complete(job):
+                _, device_id, group = job.key
+                log.warning(
+                    "Missed poll deadline of %s on device %s",
+                    group,
+                    device_id,
+                    extra={"device_id": device_id, "group": group},
+                )
+        return results
 
     def run(self):
-        """Run the client and continuously read values"""
+        """Run the client and read every register group when it is due"""
         if not self.client.connect():
             print("Failed to connect!")
             return
 
         try:
             while True:
-                self.read_all_values()
-                print("\n" + "=" * 50)
-                time.sleep(2)
+                results = self.poll_due()
+                if self.detector is not None:
+                    for device, values, _ in results:
+                        print_changes(device, values)
+                else:
+                    for device, values, groups in results:
+                        print_device_values(device, values, groups)
+                    if results:
+                        print("\n" + "=" * 50)
+
+                delay = self.poll_scheduler.delay()
+                if delay is None:
+                    break
+                time.sleep(delay)
         except KeyboardInterrupt:
             print("\nStopping client...")
         finally:
             self.client.close()
+            if self.recorder is not None:
+                self.recorder.close()
+
+
+def log_split(device_id, block):
+    """Log that a rejected block is read in parts from now on"""
+    log.info(
+        "Device %s rejected registers %d-%d, reading them in parts",
+        device_id,
+        block.address,
+        block.address + block.count - 1,
+        extra={"device_id": device_id},
+    )
+
+
+def print_device_values(device, values, groups=None):
+    """Print the decoded values of a device, optionally only some groups"""
+    print(f"\nReading from Device {device.device_id} ({device.description})")
+
+    # Read SFP values
+    if "sfps" in device.groups and (groups is None or "sfps" in groups):
+        for sfp in dict.fromkeys(field.key[1] for field in device.groups["sfps"]):
+            print(f"\nSFP {sfp}:")
+            rx_power = values.get(("sfps", sfp, "rx_power"))
+            tx_power = values.get(("sfps", sfp, "tx_power"))
+            temp = values.get(("sfps", sfp, "temperature"))
+
+            if None in (rx_power, tx_power, temp):
+                print("  Read failed")
+                continue
+            print(f"{rx_power:.2f} dBm, {tx_power:.2f} dBm, {temp:.2f} °C")
+
+    # Read product info
+    if "product_info" in device.groups and (groups is None or "product_info" in groups):
+        print("\nProduct Info:")
+        for register_field in device.groups["product_info"]:
+            label = register_field.name.replace("_", " ").title()
+            print(f"  {label}: {values.get(register_field.key)}")
+
+
+def print_changes(device, values):
+    """Print the changed values of a device, one per line"""
+    for key, value in values.items():
+        name = "/".join(str(part) for part in key)
+        if isinstance(value, float):
+            value = f"{value:.2f}"
+        print(f"Device {device.device_id} {name}: {value}")
+
+
+class AsyncModbusRTUClient(_PollingClient):
+    """Poll every configured bus concurrently on one event loop
+
+    Opens one connection per serial port or socket. Buses are polled in
+    parallel while the requests on a single bus stay serialized.
+    """
+
+    def __init__(
+        self, config_file, max_gap=8, recorder=None, metrics=None, changes_only=False
+    ):
+        super().__init__(config_file, max_gap, recorder, metrics, changes_only)
+
+        # pymodbus async clients need a running loop, see connect()
+        self.clients = {}
+        self.locks = {bus: asyncio.Lock() for bus in self.buses}
+
+    @staticmethod
+    def _create_client(bus, device):
+        """Create the pymodbus async client for a bus"""
+        transport, target = bus
+        if transport == "rtu":
+            return AsyncModbusSerialClient(
+                port=target,
+                baudrate=device.baudrate,
+                parity="N",
+                stopbits=1,
+                bytesize=8,
+            )
+
+        host, port = target
+        if transport == "udp":
+            return AsyncModbusUdpClient(host, port=port)
+        if transport == "rtu_over_tcp":
+            return AsyncModbusTcpClient(host, port=port, framer=FramerType.RTU)
+        return AsyncModbusTcpClient(host, port=port)
+
+    async def connect(self):
+        """Connect every bus and return False if any connection failed"""
+        self.clients = {
+            bus: self._create_client(bus, devices[0])
+            for bus, devices in self.buses.items()
+        }
+        if self.metrics is not None:
+            for bus, client in self.clients.items():
+                self.metrics.watch_framer(client.ctx.framer, bus)
+        results = await asyncio.gather(
+            *(client.connect() for client in self.clients.values())
+        )
+        return all(results)
+
+    def close(self):
+        """Close every bus connection and the trace"""
+        for client in self.clients.values():
+            client.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    async def _read(self, bus, device_id, block):
+        """Send a block read, returning its response or None if it raised"""
+        async with self.locks[bus]:
+            started = time.perf_counter()
+            try:
+                response = await self.clients[bus].read_holding_registers(
+                    block.address, count=block.count, slave=device_id
+                )
+            except ModbusException as exc:
+                self._read_failed(bus, device_id, exc)
+                response = None
+            if self.metrics is not None:
+                self.metrics.request(bus, started, response)
+        return response
+
+    async def read_block(self, bus, device_id, block):
+        """Read a coalesced block and decode every field it covers
+
+        A block the device rejects with an illegal data address exception is
+        split into smaller reads, which replace it from then on.
+        """
+        parts = self._split_parts(bus, device_id, block)
+        if parts is None:
+            response = await self._read(bus, device_id, block)
+            values = self._decode_response(bus, device_id, block, response)
+            if values is not None:
+                return values
+            parts = self._split_parts(bus, device_id, block)
+
+        values = {}
+        for part in parts:
+            values.update(await self.read_block(bus, device_id, part))
+        return values
+
+    async def read_device(self, bus, device_id):
+        """Read all configured fields of a device using the coalesced plan"""
+        values = {}
+        for block in self.read_plans.get((bus, device_id), []):
+            values.update(await self.read_block(bus, device_id, block))
+        return values
+
+    async def poll_bus(self, bus):
+        """Read every device on a bus one request at a time"""
+        started = time.perf_counter()
+        results = [
+            (device, await self.read_device(bus, device.device_id))
+            for device in self.buses[bus]
+        ]
+        if self.metrics is not None:
+            self.metrics.poll_cycle.observe(
+                time.perf_counter() - started, self.metrics.label(bus)
+            )
+        return results
+
+    async def read_all_values(self):
+        """Read all configured values, polling the buses concurrently"""
+        results = await asyncio.gather(*(self.poll_bus(bus) for bus in self.buses))
+        for bus_results in results:
+            for device, values in bus_results:
+                if self.detector is not None:
+                    print_changes(device, values)
+                else:
+                    print_device_values(device, values)
+
+    async def run(self, interval=2):
+        """Run the client and continuously read values"""
+        if not await self.connect():
+            print("Failed to connect!")
+            self.close()
+            return
+
+        try:
+            while True:
+                await self.read_all_values()
+                if self.detector is None:
+                    print("\n" + "=" * 50)
+                await asyncio.sleep(interval)
+        finally:
+            self.close()
 
 
 if __name__ == "__main__":
-    # Create and start client
-    client = ModbusRTUClient("modbus_register_configuration.yaml")
-    client.run()
+    parser = argparse.ArgumentParser(description="Modbus RTU client")
+    parser.add_argument(
+        "--asyncio",
+        action="store_true",
+        help="poll every configured bus concurrently",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="DIR",
+        help="append every value read to a trace the simulator can replay",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="serve round trip and poll metrics on http://127.0.0.1:PORT/metrics",
+    )
+    parser.add_argument(
+        "--changes-only",
+        action="store_true",
+        help="only print values that changed or moved past their deadband",
+    )
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging_from_args(args)
+    recorder = TraceRecorder(args.record) if args.record else None
+    metrics = MetricsRegistry() if args.metrics_port else None
+    if metrics is not None:
+        start_http_server(metrics, args.metrics_port)
+
+    if args.asyncio:
+        try:
+            asyncio.run(
+                AsyncModbusRTUClient(
+                    "modbus_register_configuration.yaml",
+                    recorder=recorder,
+                    metrics=metrics,
+                    changes_only=args.changes_only,
+                ).run()
+            )
+        except KeyboardInterrupt:
+            print("\nStopping client...")
+    else:
+        # Create and start client
+        client = ModbusRTUClient(
+            "modbus_register_configuration.yaml",
+            recorder=recorder,
+            metrics=metrics,
+            changes_only=args.changes_only,
+        )
+        client.run()
@@ -0,0 +1,130 @@
+from functools import lru_cache
+import struct
+
+
+# struct format character and register count of the numeric datatypes
+DATATYPES = {
+    "int16": ("h", 1),
+    "uint16": ("H", 1),
+    "int32": ("i", 2),
+    "uint32": ("I", 2),
+    "float32": ("f", 2),
+    "float64": ("d", 4),
+}
+
+
+@lru_cache(maxsize=None)
+def _struct(fmt):
+    """Return a cached precompiled struct for a format string"""
+    return struct.Struct(fmt)
+
+
+class RegisterCodec:
+    """Convert values of one datatype to and from 16-bit registers
+
+    Values are packed with the word order as the struct byte order and the
+    resulting bytes are read back as registers in the byte order, so any
+    byte/word order combination costs one pack and one unpack call.
+    """
+
+    __slots__ = (
+        "datatype",
+        "count",
+        "_args",
+        "_value_format",
+        "_word_order",
+        "_value",
+        "_words",
+    )
+
+    def __init__(self, datatype, length=None, byteorder="big", wordorder="big"):
+        value_order = ">" if wordorder == "big" else "<"
+        self.datatype = datatype
+        self._args = (datatype, length, byteorder, wordorder)
+
+        if datatype == "string":
+            if not length:
+                raise ValueError("string registers need a length")
+            self.count = (length + 1) // 2
+            self._value_format = None
+            self._word_order = ">" if byteorder == "big" else "<"
+        elif datatype in DATATYPES:
+            char, self.count = DATATYPES[datatype]
+            self._value_format = value_order + char
+            # Reading the packed value in the opposite order swaps the bytes
+            self._word_order = value_order if byteorder == "big" else (
+                "<" if value_order == ">" else ">"
+            )
+        else:
+            raise ValueError(f"unsupported datatype: {datatype}")
+
+        # Precompiled structs for the single value fast path
+        self._words = _struct(f"{self._word_order}{self.count}H")
+        self._value = _struct(self._value_format) if self._value_format else None
+
+    def __reduce__(self):
+        """Unpickle to the shared codec instead of a copy"""
+        return get_codec, self._args
+
+    def encode(self, value):
+        """Encode one value to a list of registers"""
+        if self._value is None:
+            return self.encode_many([value])
+        return list(self._words.unpack(self._value.pack(value)))
+
+    def decode(self, registers):
+        """Decode one value from its registers"""
+        if self._value is None:
+            return self.decode_many(registers)[0]
+        return self._value.unpack(self._words.pack(*registers))[0]
+
+    def encode_many(self, values):
+        """Encode a list of values to one flat list of registers"""
+        words = _struct(f"{self._word_order}{self.count * len(values)}H")
+        if self._value_format is None:
+            size = self.count * 2
+            data = b"".join(
+                value.encode("ascii")[:size].ljust(size, b"\0") for value in values
+            )
+        else:
+            order, char = self._value_format
+            data = _struct(f"{order}{len(values)}{char}").pack(*values)
+        return list(words.unpack(data))
+
+    def decode_many(self, registers):
+        """Decode a flat list of registers to a list of values"""
+        data = _struct(f"{self._word_order}{len(registers)}H").pack(*registers)
+        if self._value_format is None:
+            size = self.count * 2
+            return [
+                data[i : i + size].decode("ascii").rstrip("\0")
+                for i in range(0, len(data), size)
+            ]
+        order, char = self._value_format
+        return list(_struct(f"{order}{len(registers) // self.count}{char}").unpack(data))
+
+
+@lru_cache(maxsize=None)
+def _codec(datatype, length, byteorder, wordorder):
+    """Return the cached codec for normalized arguments"""
+    return RegisterCodec(datatype, length, byteorder, wordorder)
+
+
+def get_codec(datatype, length=None, byteorder="big", wordorder="big"):
+    """Return the shared codec for a datatype and byte/word order"""
+    if datatype != "string":
+        length = None
+    return _codec(datatype, length, byteorder, wordorder)
+
+
+def codec_for(spec):
+    """Return the codec for a register map entry"""
+    return get_codec(
+        spec["datatype"],
+        spec.get("length"),
+        spec.get("byteorder", "big"),
+        spec.get("wordorder", "big"),
+    )
+
+
+FLOAT32 = get_codec("float32")
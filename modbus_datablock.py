@@ -0,0 +1,326 @@
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass
+from itertools import islice
+from struct import pack_into
+import copy
+import time
+
+from pymodbus.datastore.store import BaseModbusDataBlock
+from pymodbus.exceptions import ParameterException
+
+
+class _PackFormats(dict):
+    """struct formats packing a number of native unsigned shorts, by number"""
+
+    def __missing__(self, count):
+        self[count] = f"{count}H"
+        return self[count]
+
+
+_PACK_FORMATS = _PackFormats()
+
+
+class CompactDataBlock(BaseModbusDataBlock):
+    """Sequential register datablock backed by a packed ``array('H')``
+
+    Uses two bytes per register instead of an eight byte reference per
+    register in a list. This saves memory only. Reads build a list and writes
+    pack their values into the array, so both are slower than with a list.
+    """
+
+    def __init__(self, address=0, count=65536, default_value=0):
+        self.address = address
+        self.default_value = default_value
+        self.values = array("H", [default_value]) * count
+        self._shared = False
+
+    @classmethod
+    def create(cls):
+        """Create a datablock covering the full address space"""
+        return cls(0x00, 65536)
+
+    def clone(self):
+        """Return a copy-on-write copy sharing this datablock's storage
+
+        Both datablocks copy the storage on their first write.
+        """
+        self._shared = True
+        return copy.copy(self)
+
+    @property
+    def nbytes(self):
+        """Bytes of register storage this datablock owns, shared storage is free"""
+        return 0 if self._shared else self.values.itemsize * len(self.values)
+
+    def default(self, count, value=False):
+        """Initialize the datablock to ``count`` registers of ``value``"""
+        self.default_value = int(value)
+        self.values = array("H", [self.default_value]) * count
+        self.address = 0x00
+        self._shared = False
+
+    def reset(self):
+        """Reset every register to the default value"""
+        self.values = array("H", [self.default_value]) * len(self.values)
+        self._shared = False
+
+    def validate(self, address, count=1):
+        """Check that the request lies inside the datablock"""
+        start = address - self.address
+        return start >= 0 and start + count <= len(self.values)
+
+    def getValues(self, address, count=1):
+        """Return ``count`` registers starting at ``address``"""
+        start = address - self.address
+        return self.values[start : start + count].tolist()
+
+    def setValues(self, address, values):
+        """Write registers starting at ``address``"""
+        if not isinstance(values, (list, tuple, array)):
+            values = [values]
+        if self._shared:
+            self._own()
+        offset = (address - self.address) * self.values.itemsize
+        pack_into(_PACK_FORMATS[len(values)], self.values, offset, *values)
+
+    def _own(self):
+        """Copy shared storage before it is modified"""
+        if self._shared:
+            self.values = array("H", self.values)
+            self._shared = False
+
+    def buffer(self, address, count=1):
+        """Return the writable array holding a range and the range's offset
+
+        Lets bulk writers update registers in place. The array stays valid
+        until the datablock is reset.
+        """
+        self._own()
+        return self.values, address - self.address
+
+
+class SegmentedDataBlock(BaseModbusDataBlock):
+    """Register datablock that only allocates the declared address ranges
+
+    Each segment is a contiguous ``array('H')``. Requests that are not fully
+    contained in one segment fail validation, so the server answers them
+    with an illegal data address exception like a real device would.
+    """
+
+    def __init__(self, ranges=(), padding=0, default_value=0):
+        self.default_value = default_value
+        self.starts = []
+        self.segments = []
+
+        for start, end in self._merge_ranges(ranges, padding):
+            self.starts.append(start)
+            self.segments.append(array("H", [default_value]) * (end - start))
+
+        self.address = self.starts[0] if self.starts else 0
+        self.values = self.segments
+        self._shared = [False] * len(self.segments)
+
+    @classmethod
+    def from_fields(cls, fields, padding=0):
+        """Create a datablock covering the registers of RegisterFields"""
+        return cls(((f.address, f.count) for f in fields), padding)
+
+    def clone(self):
+        """Return a copy-on-write copy sharing this datablock's segments
+
+        Segments are copied individually on their first write to either
+        datablock.
+        """
+        self._shared = [True] * len(self.segments)
+        block = copy.copy(self)
+        block.segments = list(self.segments)
+        block.values = block.segments
+        block._shared = list(self._shared)
+        return block
+
+    @property
+    def nbytes(self):
+        """Bytes of register storage this datablock owns, shared segments are free"""
+        return sum(
+            segment.itemsize * len(segment)
+            for segment, shared in zip(self.segments, self._shared)
+            if not shared
+        )
+
+    @staticmethod
+    def _merge_ranges(ranges, padding):
+        """Pad (address, count) ranges and merge the ones that touch"""
+        merged = []
+        for address, count in sorted(ranges):
+            start = max(0, address - padding)
+            end = min(65536, address + count + padding)
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    def _locate(self, address, count):
+        """Return the segment index and offset holding a range, or None"""
+        index = bisect_right(self.starts, address) - 1
+        if index < 0:
+            return None
+        offset = address - self.starts[index]
+        if offset + count > len(self.segments[index]):
+            return None
+        return index, offset
+
+    def __str__(self):
+        """Build a representation of the datablock"""
+        return f"SegmentedDataStore({len(self)}, {self.default_value})"
+
+    def __iter__(self):
+        """Iterate over (address, value) pairs of every segment"""
+        for start, segment in zip(self.starts, self.segments):
+            yield from enumerate(segment, start)
+
+    def __len__(self):
+        """Number of allocated registers"""
+        return sum(len(segment) for segment in self.segments)
+
+    def reset(self):
+        """Reset every register to the default value"""
+        self.segments = [
+            array("H", [self.default_value]) * len(segment)
+            for segment in self.segments
+        ]
+        self.values = self.segments
+        self._shared = [False] * len(self.segments)
+
+    def validate(self, address, count=1):
+        """Check that the request lies inside a single segment"""
+        return count > 0 and self._locate(address, count) is not None
+
+    def getValues(self, address, count=1):
+        """Return ``count`` registers starting at ``address``"""
+        index, offset = self._locate(address, count)
+        return self.segments[index][offset : offset + count].tolist()
+
+    def setValues(self, address, values):
+        """Write registers starting at ``address``"""
+        if not isinstance(values, (list, tuple, array)):
+            values = [values]
+        location = self._locate(address, len(values))
+        if location is None:
+            raise ParameterException(
+                f"Registers {address}-{address + len(values) - 1} are not allocated"
+            )
+        index, offset = location
+        if self._shared[index]:
+            self._own(index)
+        segment = self.segments[index]
+        offset *= segment.itemsize
+        pack_into(_PACK_FORMATS[len(values)], segment, offset, *values)
+
+    def _own(self, index):
+        """Copy a shared segment before it is modified"""
+        if self._shared[index]:
+            self.segments[index] = array("H", self.segments[index])
+            self._shared[index] = False
+
+    def buffer(self, address, count=1):
+        """Return the writable segment holding a range and the range's offset
+
+        Lets bulk writers update registers in place. The segment stays valid
+        until the datablock is reset.
+        """
+        location = self._locate(address, count)
+        if location is None:
+            raise ParameterException(
+                f"Registers {address}-{address + count - 1} are not allocated"
+            )
+        index, offset = location
+        self._own(index)
+        return self.segments[index], offset
+
+
+@dataclass
+class ComputedField:
+    """Registers recomputed at most once per ``period`` when they are read"""
+
+    address: int
+    count: int
+    compute: object
+    period: float
+    phase: float = 0.0
+    quantum: int = None
+
+
+class ComputedDataBlock(BaseModbusDataBlock):
+    """Datablock whose configured fields are computed when they are read
+
+    Wraps a datablock holding the registers. ``compute(quantum)`` of a field
+    returns its encoded registers and only runs when a read touches the field
+    in a time quantum it was not computed in yet; quantum ``k`` starts at
+    ``phase + k * period`` seconds after the datablock was created. Nothing
+    runs while no master polls.
+    """
+
+    def __init__(self, block, clock=time.monotonic):
+        self.block = block
+        self.address = block.address
+        self.default_value = block.default_value
+        self.values = block.values
+        self.clock = clock
+        self.start = clock()
+        self._starts = []
+        self._fields = []
+
+    @property
+    def nbytes(self):
+        """Bytes of register storage the wrapped datablock owns"""
+        return self.block.nbytes
+
+    def add(self, address, count, compute, period, phase=0.0):
+        """Compute ``count`` registers at ``address`` on read"""
+        if period <= 0:
+            raise ValueError("period must be positive")
+        index = bisect_right(self._starts, address)
+        self._starts.insert(index, address)
+        self._fields.insert(index, ComputedField(address, count, compute, period, phase))
+
+    def clear(self):
+        """Stop computing every field, keeping their last values"""
+        self._starts = []
+        self._fields = []
+
+    def reset(self):
+        """Reset the registers and recompute every field on its next read"""
+        self.block.reset()
+        self.values = self.block.values
+        for computed in self._fields:
+            computed.quantum = None
+
+    def validate(self, address, count=1):
+        """Check the request against the wrapped datablock"""
+        return self.block.validate(address, count)
+
+    def getValues(self, address, count=1):
+        """Return ``count`` registers, computing the stale fields among them"""
+        self._refresh(address, address + count)
+        return self.block.getValues(address, count)
+
+    def setValues(self, address, values):
+        """Write registers, computed ones are overwritten on their next quantum"""
+        self.block.setValues(address, values)
+
+    def _refresh(self, start, end):
+        """Compute the fields overlapping ``start``..``end`` that are stale"""
+        elapsed = self.clock() - self.start
+        index = max(bisect_right(self._starts, start) - 1, 0)
+        for computed in islice(self._fields, index, None):
+            if computed.address >= end:
+                break
+            if computed.address + computed.count <= start:
+                continue
+
+            quantum = int((elapsed - computed.phase) // computed.period)
+            if quantum >= 0 and quantum != computed.quantum:
+                computed.quantum = quantum
+                self.block.setValues(computed.address, computed.compute(quantum))
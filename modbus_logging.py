@@ -0,0 +1,223 @@
+from collections import OrderedDict
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+
+
+# Records per second and burst allowed per message before it is suppressed
+DEFAULT_RATE = 5.0
+DEFAULT_BURST = 20
+
+# Messages whose state the filters keep, the least recently logged are forgotten
+DEFAULT_MAX_MESSAGES = 1024
+
+# Attributes every LogRecord has, anything else was passed in ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def _extra(record):
+    """Fields passed to a log call in ``extra``"""
+    return {
+        name: value
+        for name, value in vars(record).items()
+        if name not in _RECORD_ATTRIBUTES
+    }
+
+
+class RateLimitFilter(logging.Filter):
+    """Drop records of a message that is logged more than ``rate`` times a second
+
+    Every message template gets a token bucket holding up to ``burst``
+    records. The next record that passes after some were dropped reports how
+    many in its ``suppressed`` field. Only the buckets of the
+    ``max_messages`` most recently logged messages are kept, so messages
+    formatted before they are logged do not grow the filter without bound.
+    """
+
+    def __init__(
+        self,
+        rate=DEFAULT_RATE,
+        burst=DEFAULT_BURST,
+        clock=time.monotonic,
+        max_messages=DEFAULT_MAX_MESSAGES,
+    ):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.max_messages = max_messages
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.msg)
+        now = self.clock()
+        with self._lock:
+            tokens, last, suppressed = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, suppressed + 1)
+            else:
+                self._buckets[key] = (tokens - 1, now, 0)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_messages:
+                self._buckets.popitem(last=False)
+        if tokens < 1:
+            return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Pass one in ``every`` records of a message at or below ``level``
+
+    Records above ``level`` always pass. Like RateLimitFilter, only the
+    counts of the ``max_messages`` most recently logged messages are kept.
+    """
+
+    def __init__(self, every=1, level=logging.INFO, max_messages=DEFAULT_MAX_MESSAGES):
+        super().__init__()
+        self.every = every
+        self.level = level
+        self.max_messages = max_messages
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.every <= 1 or record.levelno > self.level:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+            self._seen.move_to_end(key)
+            if len(self._seen) > self.max_messages:
+                self._seen.popitem(last=False)
+        return seen % self.every == 0
+
+
+class LazyQueueHandler(QueueHandler):
+    """Queue records without formatting them
+
+    The stock QueueHandler merges the arguments into the message in the
+    logging thread. This one leaves formatting to the listener thread, so
+    arguments must not be mutated after the call.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class StructuredFormatter(logging.Formatter):
+    """Format records as one JSON object, or logfmt ``key=value`` pairs, per line
+
+    Fields passed in ``extra`` are added to the standard ones.
+    """
+
+    def __init__(self, style="json"):
+        super().__init__()
+        self.style = style
+
+    def format(self, record):
+        fields = {
+            "time": datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_extra(record),
+        }
+        if record.exc_info:
+            fields["exception"] = self.formatException(record.exc_info)
+
+        if self.style == "json":
+            return json.dumps(fields, default=str)
+        return " ".join(
+            f"{name}={json.dumps(value, default=str)}" for name, value in fields.items()
+        )
+
+
+class TextFormatter(logging.Formatter):
+    """The usual one line format, followed by the ``extra`` fields"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        fields = _extra(record)
+        if fields:
+            text += " " + " ".join(f"{name}={value}" for name, value in fields.items())
+        return text
+
+
+def setup_logging(
+    level=logging.INFO,
+    style="text",
+    rate=DEFAULT_RATE,
+    burst=DEFAULT_BURST,
+    sample=1,
+    stream=None,
+):
+    """Route every log record through a queue to a background thread
+
+    Records are rate limited and sampled before they are queued, and
+    formatted and written by a QueueListener, so logging never blocks the
+    calling thread on I/O. ``style`` is ``text``, ``json`` or ``logfmt``.
+    Returns the listener, which is stopped at exit.
+    """
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(
+        TextFormatter() if style == "text" else StructuredFormatter(style)
+    )
+
+    records = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(records)
+    queue_handler.addFilter(SamplingFilter(sample))
+    queue_handler.addFilter(RateLimitFilter(rate, burst))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def add_logging_arguments(parser):
+    """Add the logging options of setup_logging to an ArgumentParser"""
+    parser.add_argument(
+        "--log-level",
+        default="INFO",
+        choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+        help="lowest level that is logged",
+    )
+    parser.add_argument(
+        "--log-format",
+        default="text",
+        choices=("text", "json", "logfmt"),
+        help="text lines, or one JSON object or logfmt record per line",
+    )
+    parser.add_argument(
+        "--log-sample",
+        type=int,
+        default=1,
+        metavar="N",
+        help="only log one in N repeats of an INFO or DEBUG message",
+    )
+
+
+def setup_logging_from_args(args):
+    """Call setup_logging with the options of add_logging_arguments"""
+    return setup_logging(args.log_level, args.log_format, sample=args.log_sample)
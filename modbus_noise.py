@@ -0,0 +1,275 @@
+from dataclasses import dataclass, fields
+import hashlib
+import random
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional
+    np = None
+
+
+# Samples drawn per refill of a NoiseBank
+DEFAULT_BATCH = 256
+
+# Start index of columns without a fault in the current batch
+_NO_FAULT = -(2**31)
+
+
+@dataclass(frozen=True)
+class NoiseSpec:
+    """Noise added to a simulated value on every sample
+
+    The models add up: uniform noise in ``±spread``, gaussian noise with
+    standard deviation ``sigma``, a random walk with steps of standard
+    deviation ``walk``, a linear ``drift`` per sample, and step faults that
+    start with ``fault_probability`` per sample and offset the value by
+    ``fault_offset`` for ``fault_duration`` samples.
+    """
+
+    spread: float = 0.0
+    sigma: float = 0.0
+    walk: float = 0.0
+    drift: float = 0.0
+    fault_probability: float = 0.0
+    fault_offset: float = 0.0
+    fault_duration: int = 1
+
+
+def noise_spec(spec):
+    """Create a NoiseSpec from a noise entry of the YAML"""
+    spec = dict(spec)
+    fault = spec.pop("fault", {})
+    names = {spec_field.name for spec_field in fields(NoiseSpec)}
+    unknown = (set(spec) - names) | {
+        f"fault.{name}" for name in fault if f"fault_{name}" not in names
+    }
+    if unknown:
+        raise ValueError(f"unknown noise settings {', '.join(sorted(unknown))}")
+
+    noise = NoiseSpec(
+        **spec, **{f"fault_{name}": value for name, value in fault.items()}
+    )
+    if min(noise.spread, noise.sigma, noise.walk, noise.fault_probability) < 0:
+        raise ValueError("noise amplitudes and fault probability must not be negative")
+    if noise.fault_duration < 1:
+        raise ValueError("fault duration must be at least one sample")
+    return noise
+
+
+def stream_seed(*parts):
+    """Derive a 64-bit seed from a value or a tuple of values
+
+    Integers are used as they are, anything else is hashed, so seeds like
+    ``"SN{device_id}"`` or ``(run_seed, endpoint, device_id)`` are stable
+    across processes.
+    """
+    if len(parts) == 1 and isinstance(parts[0], int):
+        return parts[0]
+    return int.from_bytes(hashlib.sha256(repr(parts).encode()).digest()[:8], "big")
+
+
+class NoiseBank:
+    """Noisy samples of a set of values drawn in batches from one stream
+
+    ``next()`` returns one sample of every value. Samples are generated
+    ``batch`` at a time with a NumPy PCG64 generator, or with
+    ``random.Random`` when NumPy is not installed. The same seed and values
+    replay the same trace bit for bit on the same backend. Values added or
+    removed after the first sample discard the samples drawn ahead, the
+    other values carry on.
+    """
+
+    def __init__(self, seed=None, batch=DEFAULT_BATCH):
+        self.batch = batch
+        self.bases = []
+        self.specs = []
+        # Samples generated before each value was added, its drift starts there
+        self.origins = []
+        # Samples handed out so far
+        self.sample_index = 0
+        self._generated = 0
+        self._rows = []
+        self._row = 0
+        self._last = None
+        self._walk_state = None
+        self._fault_left = None
+        self._spec = None
+        self._models = None
+
+        if np is not None:
+            self.rng = np.random.Generator(np.random.PCG64(seed))
+        else:
+            self.rng = random.Random(seed)
+
+    def __len__(self):
+        """Number of values in every sample"""
+        return len(self.bases)
+
+    def add(self, base, spec):
+        """Add a value and return its index in the samples"""
+        self._discard()
+        self.bases.append(base)
+        self.specs.append(spec)
+        self.origins.append(self._generated)
+        if self._walk_state is not None:
+            if np is not None:
+                self._walk_state = np.append(self._walk_state, 0.0)
+                self._fault_left = np.append(self._fault_left, 0)
+            else:
+                self._walk_state.append(0.0)
+                self._fault_left.append(0)
+        return len(self.bases) - 1
+
+    def remove(self, indices):
+        """Remove values, the later ones move down to fill their indexes"""
+        self._discard()
+        removed = set(indices)
+        keep = [index for index in range(len(self.bases)) if index not in removed]
+        self.bases = [self.bases[index] for index in keep]
+        self.specs = [self.specs[index] for index in keep]
+        self.origins = [self.origins[index] for index in keep]
+        if self._walk_state is not None:
+            if np is not None:
+                self._walk_state = self._walk_state[keep]
+                self._fault_left = self._fault_left[keep]
+            else:
+                self._walk_state = [self._walk_state[index] for index in keep]
+                self._fault_left = [self._fault_left[index] for index in keep]
+
+    def _discard(self):
+        """Skip the samples drawn ahead, before the values change"""
+        self.sample_index += len(self._rows) - self._row
+        self._rows = []
+        self._row = 0
+        self._spec = None
+
+    def next(self):
+        """Return the next sample of every value"""
+        if self._row >= len(self._rows):
+            self._rows = self._generate(self.batch)
+            self._row = 0
+        self._last = self._rows[self._row]
+        self._row += 1
+        self.sample_index += 1
+        return self._last
+
+    def sample(self, index):
+        """Return the sample with the given index, skipping ahead as needed
+
+        Samples before the latest one are gone, asking for one returns the
+        latest sample.
+        """
+        skip = index - self.sample_index
+        if skip < 0:
+            return self._last
+
+        # Jump over whole batches instead of handing out every skipped sample
+        while skip >= len(self._rows) - self._row:
+            skip -= len(self._rows) - self._row
+            self.sample_index += len(self._rows) - self._row
+            self._rows = self._generate(self.batch)
+            self._row = 0
+        self._row += skip
+        self.sample_index += skip
+        return self.next()
+
+    def _generate(self, batch):
+        """Draw the next ``batch`` samples"""
+        if np is not None:
+            return self._generate_numpy(batch)
+        return self._generate_python(batch)
+
+    def _generate_numpy(self, batch):
+        """Draw a (batch, values) array with a handful of vectorized calls"""
+        shape = (batch, len(self.bases))
+        if self._spec is None:
+            self._spec = {
+                spec_field.name: np.array(
+                    [getattr(s, spec_field.name) for s in self.specs], dtype=np.float64
+                )
+                for spec_field in fields(NoiseSpec)
+            }
+            self._spec["base"] = np.array(self.bases, dtype=np.float64)
+            self._spec["origin"] = np.array(self.origins, dtype=np.float64)
+            # Models that are off for every value draw nothing
+            self._models = {
+                name
+                for name in ("spread", "sigma", "walk", "drift", "fault_probability")
+                if self._spec[name].any()
+            }
+        spec = self._spec
+        models = self._models
+        if self._walk_state is None:
+            self._walk_state = np.zeros(len(self.bases))
+            self._fault_left = np.zeros(len(self.bases), dtype=np.int64)
+
+        values = np.tile(spec["base"], (batch, 1))
+        if "spread" in models:
+            values += self.rng.uniform(-1.0, 1.0, shape) * spec["spread"]
+        if "sigma" in models:
+            values += self.rng.standard_normal(shape) * spec["sigma"]
+
+        if "walk" in models:
+            walk = self._walk_state + np.cumsum(
+                self.rng.standard_normal(shape) * spec["walk"], axis=0
+            )
+            self._walk_state = walk[-1].copy()
+            values += walk
+
+        if "drift" in models:
+            samples = np.arange(self._generated + 1, self._generated + batch + 1)
+            values += (samples[:, None] - spec["origin"]) * spec["drift"]
+
+        if "fault_probability" in models:
+            # A fault is active for duration samples after its last start, or
+            # while one carried over from the previous batch lasts
+            duration = spec["fault_duration"].astype(np.int64)
+            rows = np.arange(batch)[:, None]
+            starts = self.rng.random(shape) < spec["fault_probability"]
+            last_start = np.maximum.accumulate(
+                np.where(starts, rows, _NO_FAULT), axis=0
+            )
+            active = (rows - last_start < duration) | (rows < self._fault_left)
+            values += np.where(active, spec["fault_offset"], 0.0)
+
+            self._fault_left = np.maximum(
+                self._fault_left - batch,
+                np.where(
+                    last_start[-1] == _NO_FAULT, 0, duration - (batch - last_start[-1])
+                ),
+            ).clip(0)
+        self._generated += batch
+        return values
+
+    def _generate_python(self, batch):
+        """Draw the samples one value at a time with random.Random"""
+        if self._walk_state is None:
+            self._walk_state = [0.0] * len(self.bases)
+            self._fault_left = [0] * len(self.bases)
+
+        rows = []
+        for _ in range(batch):
+            self._generated += 1
+            row = []
+            for index, (base, spec, origin) in enumerate(
+                zip(self.bases, self.specs, self.origins)
+            ):
+                value = base
+                if spec.spread:
+                    value += self.rng.uniform(-spec.spread, spec.spread)
+                if spec.sigma:
+                    value += self.rng.gauss(0.0, spec.sigma)
+                if spec.walk:
+                    self._walk_state[index] += self.rng.gauss(0.0, spec.walk)
+                drift = (self._generated - origin) * spec.drift
+                value += self._walk_state[index] + drift
+
+                faults = spec.fault_probability
+                if faults and self.rng.random() < faults:
+                    self._fault_left[index] = spec.fault_duration
+                if self._fault_left[index] > 0:
+                    self._fault_left[index] -= 1
+                    value += spec.fault_offset
+                row.append(value)
+            rows.append(row)
+        return rows
@@ -0,0 +1,91 @@
+from modbus_noise import NoiseBank
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional
+    np = None
+
+
+class NumpyFloatUpdater:
+    """Refresh many float32 registers with a handful of vectorized calls
+
+    Every point is its base value plus the noise of its NoiseSpec. One
+    sample of all points is drawn from a NoiseBank per update, encoded to
+    big-endian register pairs in one ``astype('>f4').view('>u2')`` and
+    scattered straight into the arrays backing the datablocks. Samples are
+    not drawn ahead in batches: for a large fleet a batch takes hundreds of
+    megabytes and stalls the update that draws it.
+
+    The bank is shared by every device, so the per-device ``seed`` parameter
+    does not apply. Adding and removing points keeps the stream and the
+    noise state of the other points.
+    """
+
+    def __init__(self, seed=None):
+        if np is None:
+            raise ImportError("NumpyFloatUpdater requires numpy")
+        self.seed = seed
+        self.points = []
+        self.bank = NoiseBank(seed, batch=1)
+        self._stale = False
+        self._targets = []
+        self._fallback = []
+
+    def add(self, context, address, base, noise):
+        """Add a float32 holding register pair to refresh on every update"""
+        self.points.append((context, address, base, noise))
+        self.bank.add(base, noise)
+        self._stale = True
+
+    def remove(self, context):
+        """Stop refreshing the points of a slave context"""
+        indices = [
+            index for index, point in enumerate(self.points) if point[0] is context
+        ]
+        if not indices:
+            return
+        self.points = [point for point in self.points if point[0] is not context]
+        self.bank.remove(indices)
+        self._stale = True
+
+    def compile(self):
+        """Precompute the scatter indexes
+
+        Runs again on the next update after points were added or removed,
+        and must be called again when a datablock is reset or replaced.
+        """
+        self._stale = False
+        groups = {}
+        self._fallback = []
+        for index, (context, address, _, _) in enumerate(self.points):
+            block = context.store["h"]
+            if not context.zero_mode:
+                address += 1
+
+            if not hasattr(block, "buffer"):
+                self._fallback.append((index, block, address))
+                continue
+
+            registers, offset = block.buffer(address, 2)
+            _, offsets, words = groups.setdefault(id(registers), (registers, [], []))
+            offsets.extend((offset, offset + 1))
+            words.extend((index * 2, index * 2 + 1))
+
+        self._targets = [
+            (registers, np.array(offsets, dtype=np.intp), np.array(words, dtype=np.intp))
+            for registers, offsets, words in groups.values()
+        ]
+
+    def update(self):
+        """Draw new values for every point and write them to the datablocks"""
+        if self._stale:
+            self.compile()
+
+        values = self.bank.next()
+        words = values.astype(">f4").view(">u2")
+
+        for registers, offsets, selection in self._targets:
+            np.frombuffer(registers, dtype=np.uint16)[offsets] = words[selection]
+
+        for index, block, address in self._fallback:
+            block.setValues(address, words[index * 2 : index * 2 + 2].tolist())
@@ -0,0 +1,63 @@
+from dataclasses import dataclass, field
+
+
+# Modbus limits a single holding register read to 125 registers
+MAX_READ_REGISTERS = 125
+
+
+@dataclass
+class ReadBlock:
+    """A contiguous range of registers fetched with one request"""
+
+    address: int
+    count: int
+    fields: list = field(default_factory=list)
+
+    def slice(self, registers, value_field):
+        """Return the registers belonging to a field of this block"""
+        offset = value_field.address - self.address
+        return registers[offset : offset + value_field.count]
+
+    def decode(self, registers):
+        """Decode every field of this block from the block's registers"""
+        return {f.key: f.codec.decode(self.slice(registers, f)) for f in self.fields}
+
+
+def plan_reads(fields, max_gap=0, max_registers=MAX_READ_REGISTERS):
+    """Merge fields into the fewest reads that respect the request size limit
+
+    Fields are merged into the current block when the number of unused
+    registers between them is at most ``max_gap`` and the resulting block
+    still fits in ``max_registers``.
+    """
+    blocks = []
+    current = None
+
+    for value_field in sorted(fields, key=lambda f: f.address):
+        end = value_field.address + value_field.count
+        if current is not None:
+            gap = value_field.address - (current.address + current.count)
+            if gap <= max_gap and end - current.address <= max_registers:
+                current.count = max(current.count, end - current.address)
+                current.fields.append(value_field)
+                continue
+
+        current = ReadBlock(value_field.address, value_field.count, [value_field])
+        blocks.append(current)
+
+    return blocks
+
+
+def split_block(block):
+    """Split a block a device rejected into smaller reads
+
+    Fields with unused registers between them go into separate reads, and a
+    block without gaps is split into one read per field. Returns an empty
+    list for a block of a single field.
+    """
+    if len(block.fields) <= 1:
+        return []
+    blocks = plan_reads(block.fields, max_gap=0, max_registers=block.count)
+    if len(blocks) == 1:
+        blocks = [ReadBlock(f.address, f.count, [f]) for f in blocks[0].fields]
+    return blocks
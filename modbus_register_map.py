@@ -0,0 +1,518 @@
+from dataclasses import dataclass, replace
+import hashlib
+import json
+import logging
+import os
+import pickle
+
+import yaml
+
+from modbus_codec import RegisterCodec, codec_for
+from modbus_noise import noise_spec
+
+
+log = logging.getLogger(__name__)
+
+# Bump when the compiled classes change to invalidate existing caches
+CACHE_VERSION = 6
+
+# Use libyaml's parser when PyYAML was built with it
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Transports a device can be reached over
+TRANSPORTS = ("rtu", "tcp", "rtu_over_tcp", "udp")
+
+# Baudrate of serial devices without a "baudrate" entry in the YAML
+DEFAULT_BAUDRATE = 9600
+
+# Update timing of register groups without an "update" entry in the YAML
+DEFAULT_UPDATE = {
+    "sfps": {"period": 1.0},
+    "product_info": {"period": 10.0},
+}
+
+# Poll timing of register groups without a "poll" entry in the YAML
+DEFAULT_POLL = {
+    "sfps": {"period": 2.0},
+    "product_info": {"period": 2.0},
+}
+
+# Per-device parameters of the simulated values
+DEVICE_PARAMS = (
+    "tx_power",
+    "rx_power",
+    "temperature",
+    "product_number",
+    "serial_number",
+    "seed",
+)
+
+# Slave ids a fleet may use
+FLEET_IDS = range(1, 248)
+
+
+class RegisterMapError(ValueError):
+    """Raised when the register configuration is invalid"""
+
+
+@dataclass(frozen=True)
+class RegisterField:
+    """A single value in the register map"""
+
+    __slots__ = ("key", "group", "name", "address", "count", "codec")
+
+    key: tuple
+    group: str
+    name: str
+    address: int
+    count: int
+    codec: RegisterCodec
+
+    def __reduce__(self):
+        """Pickle through the constructor, frozen slots reject setattr"""
+        return self.__class__, tuple(getattr(self, name) for name in self.__slots__)
+
+
+@dataclass
+class DeviceConfig:
+    """A validated device with its registers flattened and grouped"""
+
+    __slots__ = (
+        "device_id",
+        "description",
+        "transport",
+        "endpoint",
+        "bus",
+        "baudrate",
+        "fields",
+        "groups",
+        "update",
+        "poll",
+        "template_key",
+        "params",
+        "noise",
+        "deadband",
+    )
+
+    device_id: int
+    description: str
+    transport: str
+    # (transport, target) the simulator serves the device on
+    endpoint: tuple
+    # (transport, target) the client polls the device on
+    bus: tuple
+    baudrate: int
+    fields: tuple
+    # Fields per register group
+    groups: dict
+    # (period, phase, jitter) per register group
+    update: dict
+    # (period, priority, phase) per register group, period None reads once
+    poll: dict
+    # Devices with the same key have identical register maps
+    template_key: str
+    # Simulation parameters, see DEVICE_PARAMS
+    params: dict
+    # NoiseSpec per simulated field name
+    noise: dict
+    # Change a numeric field must exceed to be reported again, per field name
+    deadband: dict
+
+
+@dataclass
+class RegisterMap:
+    """The compiled register configuration of every device"""
+
+    __slots__ = ("devices",)
+
+    devices: tuple
+
+
+def _mapping(value, what):
+    """Return a mapping of the YAML, raising RegisterMapError for anything else"""
+    if not isinstance(value, dict):
+        raise RegisterMapError(f"{what} must be a mapping")
+    return value
+
+
+def _sequence(value, what):
+    """Return a list of the YAML, raising RegisterMapError for anything else"""
+    if not isinstance(value, list):
+        raise RegisterMapError(f"{what} must be a list")
+    return value
+
+
+def _integer(value, what):
+    """Return an integer of the YAML, raising RegisterMapError for anything else"""
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise RegisterMapError(f"{what} must be an integer")
+    return value
+
+
+def _number(value, what):
+    """Return a number of the YAML, raising RegisterMapError for anything else"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RegisterMapError(f"{what} must be a number")
+    return value
+
+
+def _socket_target(device, name):
+    """Parse a "host:port" entry into a (host, port) tuple"""
+    address = device[name]
+    host, _, port = str(address).rpartition(":")
+    try:
+        return host, int(port)
+    except ValueError:
+        raise RegisterMapError(f"{name} {address!r} is not host:port") from None
+
+
+def _compile_field(key, spec):
+    """Create a RegisterField from a register map entry"""
+    _mapping(spec, f"{key}")
+    if "address" not in spec or "datatype" not in spec:
+        raise RegisterMapError(f"{key}: address and datatype are required")
+    try:
+        codec = codec_for(spec)
+    except (TypeError, ValueError) as exc:
+        raise RegisterMapError(f"{key}: {exc}") from None
+
+    address = _integer(spec["address"], f"{key}: address")
+    if not 0 <= address <= 65536 - codec.count:
+        raise RegisterMapError(f"{key}: address {address} is out of range")
+    return RegisterField(key, key[0], key[-1], address, codec.count, codec)
+
+
+def _compile_fields(registers):
+    """Flatten the register groups of a device into RegisterFields
+
+    A group is either a mapping of names to entries, or a list of mappings
+    that carry one scalar identifier next to their entries (like ``sfp: 1``).
+    """
+    fields = []
+    for group, entries in _mapping(registers, "registers").items():
+        if isinstance(entries, dict):
+            for name, spec in entries.items():
+                fields.append(_compile_field((group, name), spec))
+            continue
+
+        for entry in _sequence(entries, f"{group}"):
+            _mapping(entry, f"{group} entries")
+            ids = [value for value in entry.values() if not isinstance(value, dict)]
+            if len(ids) != 1:
+                raise RegisterMapError(f"{group}: entries need exactly one identifier")
+            for name, spec in entry.items():
+                if isinstance(spec, dict):
+                    fields.append(_compile_field((group, ids[0], name), spec))
+    return fields
+
+
+def _timing(defaults, overrides, group, fallback, what):
+    """Merge and check the default and configured timing of a register group"""
+    timing = {
+        **defaults.get(group, fallback),
+        **_mapping(_mapping(overrides, what).get(group, {}), f"{what} of {group}"),
+    }
+    for name in ("period", "phase", "jitter", "priority"):
+        if name in timing:
+            _number(timing[name], f"{what} {name} of {group}")
+    if timing["period"] <= 0:
+        raise RegisterMapError(f"{what} period of {group} must be positive")
+    return timing
+
+
+def compile_device(device):
+    """Validate one device entry of the YAML and compile it"""
+    _mapping(device, "every device")
+    if "device_id" not in device:
+        raise RegisterMapError("every device needs a device_id")
+    device_id = _integer(device["device_id"], "device_id")
+
+    transport = device.get("transport", "rtu")
+    if transport not in TRANSPORTS:
+        raise RegisterMapError(f"device {device_id}: unsupported transport {transport}")
+
+    try:
+        if transport == "rtu":
+            endpoint = (transport, device.get("server_port", device["com_port"]))
+            bus = (transport, device["com_port"])
+        else:
+            endpoint = (transport, _socket_target(device, "server_address"))
+            client = "client_address" if "client_address" in device else "server_address"
+            bus = (transport, _socket_target(device, client))
+    except KeyError as exc:
+        raise RegisterMapError(f"device {device_id}: missing {exc}") from None
+    except RegisterMapError as exc:
+        raise RegisterMapError(f"device {device_id}: {exc}") from None
+
+    baudrate = device.get("baudrate", DEFAULT_BAUDRATE if transport == "rtu" else None)
+    if baudrate is not None:
+        _integer(baudrate, f"device {device_id}: baudrate")
+
+    registers = device.get("registers", {})
+    try:
+        fields = tuple(_compile_fields(registers))
+        update = {}
+        poll = {}
+        for register_field in fields:
+            group = register_field.group
+            if group in update:
+                continue
+            timing = _timing(
+                DEFAULT_UPDATE, device.get("update", {}), group, {"period": 1.0}, "update"
+            )
+            update[group] = (
+                timing["period"],
+                timing.get("phase", 0.0),
+                timing.get("jitter", 0.0),
+            )
+
+            timing = _timing(
+                DEFAULT_POLL, device.get("poll", {}), group, {"period": 2.0}, "poll"
+            )
+            poll[group] = (
+                None if timing.get("once") else timing["period"],
+                timing.get("priority", 0),
+                timing.get("phase", 0.0),
+            )
+
+        params = _mapping(device.get("params", {}), "params")
+        noise_specs = _mapping(device.get("noise", {}), "noise")
+        deadband = _mapping(device.get("deadband", {}), "deadband")
+    except RegisterMapError as exc:
+        raise RegisterMapError(f"device {device_id}: {exc}") from None
+
+    groups = {}
+    # Field occupying each register address, to reject overlapping fields
+    index = {}
+    for register_field in fields:
+        groups.setdefault(register_field.group, []).append(register_field)
+        for address in range(
+            register_field.address, register_field.address + register_field.count
+        ):
+            if address in index:
+                raise RegisterMapError(
+                    f"device {device_id}: {register_field.key} overlaps "
+                    f"{index[address].key} at address {address}"
+                )
+            index[address] = register_field
+
+    unknown = set(params) - set(DEVICE_PARAMS)
+    if unknown:
+        raise RegisterMapError(
+            f"device {device_id}: unknown params {', '.join(sorted(unknown))}"
+        )
+
+    noise = {}
+    for name, spec in noise_specs.items():
+        try:
+            noise[name] = noise_spec(spec)
+        except (TypeError, ValueError) as exc:
+            raise RegisterMapError(f"device {device_id}: noise of {name}: {exc}") from None
+
+    names = {
+        register_field.name
+        for register_field in fields
+        if register_field.codec.datatype != "string"
+    }
+    for name, value in deadband.items():
+        if name not in names:
+            raise RegisterMapError(
+                f"device {device_id}: deadband of unknown or non-numeric value {name}"
+            )
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise RegisterMapError(
+                f"device {device_id}: deadband of {name} must be a non-negative number"
+            )
+
+    return DeviceConfig(
+        device_id,
+        device.get("description", f"Device {device_id}"),
+        transport,
+        endpoint,
+        bus,
+        baudrate,
+        fields,
+        {group: tuple(group_fields) for group, group_fields in groups.items()},
+        update,
+        poll,
+        json.dumps(registers, sort_keys=True),
+        params,
+        noise,
+        deadband,
+    )
+
+
+def _format_param(value, device_id):
+    """Expand the {device_id} placeholder of a string parameter"""
+    if not isinstance(value, str):
+        return value
+    try:
+        return value.format(device_id=device_id)
+    except (IndexError, KeyError, ValueError) as exc:
+        raise RegisterMapError(f"device {device_id}: cannot format {value!r}: {exc}") from None
+
+
+def compile_fleet(fleet):
+    """Expand a fleet entry of the YAML into one DeviceConfig per slave
+
+    The template is compiled once per bus; every instance shares its fields
+    and groups and only gets its own id, description and params.
+    """
+    _mapping(fleet, "every fleet")
+    if "template" not in fleet or "device_ids" not in fleet:
+        raise RegisterMapError("every fleet needs a template and device_ids")
+
+    device_ids = _sequence(fleet["device_ids"], "fleet device_ids")
+    if len(device_ids) != 2:
+        raise RegisterMapError("fleet device_ids must be [first, last]")
+    first, last = (_integer(device_id, "fleet device_ids") for device_id in device_ids)
+    if first > last or first not in FLEET_IDS or last not in FLEET_IDS:
+        raise RegisterMapError(f"fleet device_ids {first}..{last} are out of range")
+
+    template = _mapping(fleet["template"], "fleet template")
+    params = {
+        **_mapping(template.get("params", {}), "fleet template params"),
+        **_mapping(fleet.get("params", {}), "fleet params"),
+    }
+    overrides = _mapping(fleet.get("overrides", {}), "fleet overrides")
+    unknown = set(overrides) - set(range(first, last + 1))
+    if unknown:
+        raise RegisterMapError(f"fleet overrides unknown device ids {sorted(unknown)}")
+    for device_id, override in overrides.items():
+        _mapping(override, f"fleet override of device {device_id}")
+        unknown = set(override) - set(DEVICE_PARAMS)
+        if unknown:
+            raise RegisterMapError(
+                f"device {device_id}: unknown params {', '.join(sorted(unknown))}"
+            )
+
+    devices = []
+    for bus in _sequence(fleet.get("buses", [{}]), "fleet buses"):
+        bus = _mapping(bus, "fleet buses")
+        compiled = compile_device({**template, **bus, "device_id": first, "params": params})
+        description = str(template.get("description", "Device {device_id}"))
+
+        for device_id in range(first, last + 1):
+            instance_params = {
+                name: _format_param(value, device_id)
+                for name, value in {**params, **overrides.get(device_id, {})}.items()
+            }
+            devices.append(
+                replace(
+                    compiled,
+                    device_id=device_id,
+                    description=_format_param(description, device_id),
+                    params=instance_params,
+                )
+            )
+    return devices
+
+
+def compile_register_map(config):
+    """Validate the parsed YAML and compile it into a RegisterMap"""
+    _mapping(config, "the register configuration")
+    devices = [
+        compile_device(device)
+        for device in _sequence(config.get("modbus_devices", []), "modbus_devices")
+    ]
+    for fleet in _sequence(config.get("fleets", []), "fleets"):
+        devices.extend(compile_fleet(fleet))
+    devices = tuple(devices)
+
+    seen = set()
+    for device in devices:
+        key = (device.endpoint, device.device_id)
+        if key in seen:
+            raise RegisterMapError(
+                f"device {device.device_id} is configured twice on {device.endpoint[1]}"
+            )
+        seen.add(key)
+
+    return RegisterMap(devices)
+
+
+def default_cache_dir(config_file):
+    """Directory the compiled map of a configuration file is cached in"""
+    return os.path.join(os.path.dirname(os.path.abspath(config_file)), ".regmap_cache")
+
+
+def _cache_path(cache_dir, config_file, data):
+    """Cache file of a configuration, keyed by its content hash"""
+    digest = hashlib.sha256(data + str(CACHE_VERSION).encode()).hexdigest()
+    name = os.path.splitext(os.path.basename(config_file))[0]
+    return os.path.join(cache_dir, f"{name}.{digest[:32]}.pickle")
+
+
+def _read_cache(path):
+    """Return the cached RegisterMap, or None when it is missing or unusable"""
+    try:
+        with open(path, "rb") as f:
+            register_map = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as exc:  # a corrupt cache must never block startup
+        log.warning("Ignoring unreadable register map cache %s: %s", path, exc)
+        return None
+    return register_map if isinstance(register_map, RegisterMap) else None
+
+
+def _write_cache(path, register_map):
+    """Store a compiled map atomically, skipping unwritable directories"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            pickle.dump(register_map, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        log.debug("Not caching the register map in %s: %s", path, exc)
+        return
+    _prune_cache(path)
+
+
+def _prune_cache(path):
+    """Remove the cached maps of older versions of the same configuration"""
+    cache_dir, current = os.path.split(path)
+    # Cache files are named <config name>.<32 hex digits>.pickle
+    prefix = current[: -len(".pickle") - 32]
+    try:
+        entries = os.listdir(cache_dir)
+    except OSError:
+        return
+    for entry in entries:
+        digest = entry[len(prefix) : -len(".pickle")]
+        if (
+            entry != current
+            and entry.startswith(prefix)
+            and entry.endswith(".pickle")
+            and len(digest) == 32
+            and all(char in "0123456789abcdef" for char in digest)
+        ):
+            try:
+                os.remove(os.path.join(cache_dir, entry))
+            except OSError as exc:
+                log.debug("Not removing stale register map cache %s: %s", entry, exc)
+
+
+def load_register_map(config_file, cache_dir=""):
+    """Parse and compile a register configuration file
+
+    The compiled map is cached in ``cache_dir`` (by default a
+    ``.regmap_cache`` directory next to the file) under the SHA-256 of the
+    file's content, so unchanged configurations load without parsing YAML.
+    Pass ``cache_dir=None`` to disable the cache.
+    """
+    with open(config_file, "rb") as f:
+        data = f.read()
+
+    path = None
+    if cache_dir is not None:
+        path = _cache_path(cache_dir or default_cache_dir(config_file), config_file, data)
+        register_map = _read_cache(path)
+        if register_map is not None:
+            return register_map
+
+    register_map = compile_register_map(yaml.load(data, Loader=YamlLoader))
+    if path is not None:
+        _write_cache(path, register_map)
+    return register_map
@@ -0,0 +1,205 @@
+from collections import deque
+from dataclasses import dataclass
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class ScheduledTask:
+    """A callback that runs every ``period`` seconds"""
+
+    callback: object
+    period: float
+    jitter: float = 0.0
+    nominal: float = 0.0
+    cancelled: bool = False
+
+
+class UpdateScheduler:
+    """Heap based scheduler that only runs the tasks that are due
+
+    Each task runs at ``start + phase + k * period``, shifted by a random
+    offset of at most ``jitter`` seconds. The jitter never accumulates, and
+    ticks missed because a callback overran are skipped, not replayed.
+    Exceptions raised by a callback are logged and the task stays scheduled.
+    With ``on_run`` set, ``on_run(task, lag, duration)`` is called after
+    every run with the seconds it started late and the seconds it took.
+    ``call_soon`` lets other threads hand work to the thread running the
+    tasks.
+    """
+
+    def __init__(self, clock=time.monotonic, seed=None, on_run=None):
+        self.clock = clock
+        self.rng = random.Random(seed)
+        self.on_run = on_run
+        self._heap = []
+        self._sequence = itertools.count()
+        self._calls = deque()
+
+    def add(self, callback, period, phase=0.0, jitter=0.0):
+        """Schedule ``callback`` to run every ``period`` seconds"""
+        if period <= 0:
+            raise ValueError("period must be positive")
+        task = ScheduledTask(callback, period, jitter, self.clock() + phase)
+        self._push(task)
+        return task
+
+    def cancel(self, task):
+        """Stop running a task"""
+        task.cancelled = True
+
+    def call_soon(self, callback):
+        """Run ``callback`` once before the next due tasks, from any thread"""
+        self._calls.append(callback)
+
+    def _push(self, task):
+        """Queue the next run of a task"""
+        due = task.nominal
+        if task.jitter:
+            due += self.rng.uniform(-task.jitter, task.jitter)
+        heapq.heappush(self._heap, (due, next(self._sequence), task))
+
+    def next_due(self):
+        """Return the time the next task is due, or None without tasks"""
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def run_pending(self):
+        """Run every task that is due and return how many ran"""
+        while self._calls:
+            callback = self._calls.popleft()
+            try:
+                callback()
+            except Exception:
+                log.exception("Call %r failed", callback)
+
+        now = self.clock()
+        ran = 0
+        while self._heap and self._heap[0][0] <= now:
+            due, _, task = heapq.heappop(self._heap)
+            if task.cancelled:
+                continue
+
+            try:
+                if self.on_run is None:
+                    task.callback()
+                else:
+                    started = self.clock()
+                    task.callback()
+                    self.on_run(task, started - due, self.clock() - started)
+            except Exception:
+                # A failing task must not stop the others, it runs again
+                # on its next tick
+                log.exception("Scheduled task %r failed", task.callback)
+            ran += 1
+
+            task.nominal += task.period
+            if task.nominal <= now:
+                # Skip the ticks that were missed
+                missed = (now - task.nominal) // task.period + 1
+                task.nominal += missed * task.period
+            self._push(task)
+        return ran
+
+    def _delay(self):
+        """Seconds until the next task is due"""
+        due = self.next_due()
+        if due is None:
+            return 1.0
+        return max(0.0, due - self.clock())
+
+    def run_forever(self, sleep=time.sleep):
+        """Run tasks as they become due until the process exits"""
+        while True:
+            self.run_pending()
+            sleep(self._delay())
+
+    async def run_async(self):
+        """Run tasks as they become due on the running event loop
+
+        Callbacks run synchronously between other coroutines, so they are
+        atomic relative to request handling on the same loop.
+        """
+        while True:
+            self.run_pending()
+            await asyncio.sleep(self._delay())
+
+
+@dataclass
+class PollJob:
+    """A periodic read whose deadline is one period after its release"""
+
+    key: object
+    period: float = None
+    priority: int = 0
+    release: float = 0.0
+
+    @property
+    def deadline(self):
+        """Time by which the read must have completed"""
+        if self.period is None:
+            return float("inf")
+        return self.release + self.period
+
+
+class PollScheduler:
+    """Earliest-deadline-first scheduler for periodic reads
+
+    ``pop_due`` hands out every released job, ordered by deadline and then
+    by descending priority, so the caller can coalesce the reads that are
+    due together. ``complete`` records missed deadlines and releases the
+    job again. Jobs without a period run once.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.missed = 0
+        self._heap = []
+        self._sequence = itertools.count()
+
+    def add(self, key, period=None, priority=0, phase=0.0):
+        """Schedule a read first released ``phase`` seconds from now"""
+        if period is not None and period <= 0:
+            raise ValueError("period must be positive")
+        job = PollJob(key, period, priority, self.clock() + phase)
+        heapq.heappush(self._heap, (job.release, next(self._sequence), job))
+        return job
+
+    def pop_due(self):
+        """Remove and return the released jobs in the order they should run"""
+        now = self.clock()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        due.sort(key=lambda job: (job.deadline, -job.priority))
+        return due
+
+    def complete(self, job, finished=None):
+        """Release a finished job again and return whether it was late"""
+        finished = self.clock() if finished is None else finished
+        late = finished > job.deadline
+        if late:
+            self.missed += 1
+
+        if job.period is not None:
+            job.release += job.period
+            if job.release <= finished:
+                # Skip the releases that were missed
+                skipped = (finished - job.release) // job.period + 1
+                job.release += skipped * job.period
+            heapq.heappush(self._heap, (job.release, next(self._sequence), job))
+        return late
+
+    def delay(self):
+        """Seconds until the next job is released, or None without jobs"""
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - self.clock())
@@ -0,0 +1,84 @@
+from collections import OrderedDict
+
+from pymodbus.datastore import ModbusServerContext
+from pymodbus.exceptions import NoSuchSlaveException
+
+
+class LazyServerContext(ModbusServerContext):
+    """Server context that creates slave contexts on their first request
+
+    ``factory(slave)`` builds the context of a configured slave id. With
+    ``max_active`` set, the least recently addressed slaves beyond that many
+    are dropped, calling ``on_evict(slave, context)``, and built again from
+    the factory when they are addressed next. Evicted slaves lose the values
+    written to them.
+    """
+
+    def __init__(self, factory, slave_ids=(), max_active=None, on_evict=None):
+        super().__init__(single=False)
+        self.factory = factory
+        self.max_active = max_active
+        self.on_evict = on_evict
+        self._configured = set(slave_ids)
+        self._slaves = OrderedDict()
+
+    def __contains__(self, slave):
+        """Check if a slave is configured, whether or not it is active"""
+        return slave in self._configured
+
+    def __getitem__(self, slave):
+        """Return the context of a slave, creating it if needed"""
+        context = self._slaves.get(slave)
+        if context is not None:
+            self._slaves.move_to_end(slave)
+            return context
+
+        if slave not in self._configured:
+            raise NoSuchSlaveException(
+                f"slave - {slave} does not exist, or is out of range"
+            )
+        context = self.factory(slave)
+        self._slaves[slave] = context
+        self._evict()
+        return context
+
+    def __setitem__(self, slave, context):
+        """Configure a slave and make the given context active"""
+        super().__setitem__(slave, context)
+        self._configured.add(slave)
+        self._slaves.move_to_end(slave)
+        self._evict()
+
+    def __delitem__(self, slave):
+        """Remove a slave without calling on_evict"""
+        if slave not in self._configured:
+            raise NoSuchSlaveException(f"slave index: {slave} out of range")
+        self._configured.discard(slave)
+        self._slaves.pop(slave, None)
+
+    def configure(self, slave):
+        """Add a slave that is created on its first request"""
+        if not 0 <= slave <= 0xF7:
+            raise NoSuchSlaveException(f"slave index :{slave} out of range")
+        self._configured.add(slave)
+
+    def peek(self, slave):
+        """Return the context of an active slave without creating it, or None"""
+        return self._slaves.get(slave)
+
+    def slaves(self):
+        """Return every configured slave id"""
+        return sorted(self._configured)
+
+    def active(self):
+        """Return the ids of the slaves whose contexts exist"""
+        return list(self._slaves)
+
+    def _evict(self):
+        """Drop the least recently used slaves beyond max_active"""
+        if self.max_active is None:
+            return
+        while len(self._slaves) > self.max_active:
+            slave, context = self._slaves.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(slave, context)
@@ -1,235 +1,903 @@
 import logging
-from pymodbus.server import StartSerialServer
+from pymodbus.framer import FramerType
+from pymodbus.server import ModbusSerialServer, ModbusTcpServer, ModbusUdpServer
 from pymodbus.datastore import (
-    ModbusSequentialDataBlock,
     ModbusSlaveContext,
     ModbusServerContext,
 )
 from pymodbus.device import ModbusDeviceIdentification
-from pymodbus.payload import BinaryPayloadBuilder
-from pymodbus.constants import Endian
-import struct
-import random
-import yaml
+from modbus_codec import FLOAT32, get_codec
+from modbus_datablock import CompactDataBlock, ComputedDataBlock, SegmentedDataBlock
+from modbus_logging import add_logging_arguments, setup_logging_from_args
+from modbus_metrics import MetricsRegistry, endpoint_label, start_http_server
+from modbus_noise import NoiseBank, NoiseSpec, stream_seed
+from modbus_numpy_engine import NumpyFloatUpdater
+from modbus_register_map import load_register_map
+from modbus_scheduler import UpdateScheduler
+from modbus_server_context import LazyServerContext
+from modbus_trace import TraceReplayer
+from collections import deque
+from functools import partial
+import argparse
+import asyncio
+import os
+import signal
 import time
 import threading
+import yaml
 
-# Configure logging
-logging.basicConfig()
-log = logging.getLogger()
-log.setLevel(logging.INFO)
+log = logging.getLogger(__name__)
 
+# SFP values the simulated telemetry varies around
+SFP_BASE_VALUES = {
+    1: {"tx_power": 3.0, "rx_power": 0.07, "temperature": 25.0},
+    2: {"tx_power": 3.0, "rx_power": 0.07, "temperature": 25.0},
+    3: {"tx_power": 3.0, "rx_power": 0.07, "temperature": 25.0},
+    4: {"tx_power": 3.0, "rx_power": 0.07, "temperature": 25.0},
+}
 
-class ModbusRTUSimulator:
-    def __init__(self, config_file):
-        # Load configuration
-        with open(config_file, "r") as f:
-            self.config = yaml.safe_load(f)
+# Maximum random deviation from the base value on every update, used for
+# values without a noise entry in the YAML
+SFP_VARIATION = {"tx_power": 0.05, "rx_power": 0.03, "temperature": 1.0}
 
-        # Create a ModbusServerContext with a single slave context
-        self.context = self._setup_server_context()
+# Seconds between writes of the replayed trace values
+REPLAY_INTERVAL = 0.1
+
+# Transports a device can be served on and the framer each one uses
+TRANSPORT_FRAMERS = {
+    "rtu": FramerType.RTU,
+    "tcp": FramerType.SOCKET,
+    "rtu_over_tcp": FramerType.RTU,
+    "udp": FramerType.SOCKET,
+}
 
-    def _create_slave_context(self) -> ModbusSlaveContext:
-        """Create a ModbusSlaveContext for the specified device"""
-        hr = ModbusSequentialDataBlock(0, [0] * 65536)
-        ir = ModbusSequentialDataBlock(0, [0] * 65536)
 
-        return ModbusSlaveContext(hr=hr, ir=ir, zero_mode=True)
+class ModbusRTUSimulator:
+    def __init__(
+        self,
+        config_file,
+        sparse=False,
+        padding=0,
+        engine="python",
+        watch_interval=None,
+        lazy=False,
+        max_active=None,
+        seed=None,
+        trace=None,
+        speed=1.0,
+        loop=False,
+        metrics=None,
+    ):
+        # Load and compile the register configuration
+        self.config_file = config_file
+        self.config_mtime = os.stat(config_file).st_mtime_ns
+        self.register_map = load_register_map(config_file)
+
+        # Only allocate the declared register ranges when sparse is set
+        self.sparse = sparse
+        self.padding = padding
+
+        # Initialized slave contexts shared by devices with the same registers
+        self.templates = {}
+
+        # Optionally refresh all SFP values with vectorized NumPy calls
+        self.engine = engine
+
+        # Derive the noise stream of every device without its own seed from
+        # this seed, so whole runs can be replayed
+        self.seed = seed
+
+        # Optionally count requests and time the updates in a MetricsRegistry
+        self.metrics = metrics
+        self.pending_requests = {}
+        if metrics is not None:
+            self._create_metrics(metrics)
+
+        # Recompute each register group at its own update rate
+        self.scheduler = UpdateScheduler(
+            on_run=self._observe_update if metrics is not None else None
+        )
+        self.device_tasks = {}
+        self.sfp_engines = {}
+
+        # Optionally replay a trace recorded by the client at speed times
+        # real time instead
+        self.replayer = None
+        if trace is not None:
+            self.replayer = TraceReplayer(trace, speed, loop)
+            self.scheduler.add(self.replayer.update, REPLAY_INTERVAL)
+
+        # Create slave contexts on their first request when lazy is set, and
+        # keep at most max_active of them per endpoint
+        self.lazy = lazy
+        self.max_active = max_active
+
+        # Group the devices by the serial port or socket they are served on
+        self.device_index = {
+            self.device_key(device): device for device in self.register_map.devices
+        }
+        self.endpoints = self._group_endpoints(self.register_map)
+
+        # Create a ModbusServerContext per endpoint with one slave per device
+        self.contexts = self._setup_server_contexts()
+
+        # Reload the configuration on SIGHUP, or when the file changes if
+        # watch_interval is set
+        self.watch_interval = watch_interval
+        self._reload_requested = False
+        self.scheduler.add(self.check_config, watch_interval or 1.0)
+
+        # Running servers per endpoint, see serve_endpoints()
+        self.servers = {}
+        self.loop = None
+
+    def _create_metrics(self, metrics):
+        """Register the simulator's metrics"""
+        self.request_count = metrics.counter(
+            "modbus_simulator_requests_total",
+            "Requests served per endpoint, slave, function code and status",
+            ("endpoint", "slave", "function", "status"),
+        )
+        self.request_latency = metrics.histogram(
+            "modbus_simulator_request_seconds",
+            "Time from decoding a request to sending its response",
+            ("endpoint", "function"),
+        )
+        self.update_duration = metrics.histogram(
+            "modbus_simulator_update_seconds",
+            "Run time of scheduled value updates",
+            ("task",),
+        )
+        self.update_lag = metrics.histogram(
+            "modbus_simulator_update_lag_seconds",
+            "Seconds scheduled value updates started after they were due",
+            ("task",),
+        )
+        metrics.gauge(
+            "modbus_simulator_active_devices",
+            "Devices whose slave context exists",
+            ("endpoint",),
+            function=partial(self._datastore_size, len),
+        )
+        metrics.gauge(
+            "modbus_simulator_datastore_bytes",
+            "Register storage owned by the active slave contexts",
+            ("endpoint",),
+            function=partial(self._datastore_size, self._context_bytes),
+        )
+
+    def _observe_update(self, task, lag, duration):
+        """Record the lag and run time of a scheduled update"""
+        name = getattr(task.callback, "func", task.callback).__name__
+        self.update_lag.observe(max(lag, 0.0), name)
+        self.update_duration.observe(duration, name)
+
+    def _trace_request(self, endpoint, request, *addr):
+        """Note when a request was decoded, pymodbus calls this first"""
+        key = (endpoint, request.slave_id, request.transaction_id)
+        self.pending_requests.setdefault(key, deque()).append(time.perf_counter())
+
+    def _measure_response(self, endpoint, response):
+        """Count a response and record its latency, then send it unchanged
+
+        Requests run in the order they were decoded, so the response belongs
+        to the oldest pending request with its slave and transaction id.
+        """
+        function = response.function_code & 0x7F
+        status = "exception" if response.function_code & 0x80 else "ok"
+        label = endpoint_label(endpoint)
+        self.request_count.inc(label, response.slave_id, function, status)
+
+        key = (endpoint, response.slave_id, response.transaction_id)
+        started = self.pending_requests.get(key)
+        if started:
+            self.request_latency.observe(
+                time.perf_counter() - started.popleft(), label, function
+            )
+            if not started:
+                del self.pending_requests[key]
+        return response, False
 
-    def _setup_server_context(self):
-        """Setup server context for both devices"""
+    def _datastore_size(self, measure):
+        """Measure the active slave contexts of every endpoint"""
         contexts = {}
-        slave_context = self._create_slave_context()
+        for device in list(self.device_index.values()):
+            context = self._active_context(device)
+            if context is not None:
+                contexts.setdefault(endpoint_label(device.endpoint), []).append(context)
+        return {(endpoint,): measure(found) for endpoint, found in contexts.items()}
+
+    @staticmethod
+    def _context_bytes(contexts):
+        """Register storage owned by slave contexts"""
+        return sum(
+            getattr(block, "nbytes", 0)
+            for context in contexts
+            for block in context.store.values()
+        )
+
+    def _create_slave_context(self, fields=()) -> ModbusSlaveContext:
+        """Create a ModbusSlaveContext for the specified device"""
+        if self.sparse:
+            # Only the holding registers are declared in the register map
+            hr = SegmentedDataBlock.from_fields(fields, self.padding)
+            ir = SegmentedDataBlock()
+            di = SegmentedDataBlock()
+            co = SegmentedDataBlock()
+        else:
+            hr = CompactDataBlock(0, 65536)
+            ir = CompactDataBlock(0, 65536)
+            di = CompactDataBlock(0, 65536)
+            co = CompactDataBlock(0, 65536)
+
+        # pymodbus shares one default di and co block between all contexts
+        return ModbusSlaveContext(di=di, co=co, hr=hr, ir=ir, zero_mode=True)
+
+    def _create_template(self, device) -> ModbusSlaveContext:
+        """Create an initialized slave context to clone devices from"""
+        template = self._create_slave_context(device.fields)
+
+        if "sfps" in device.groups:
+            self.init_sfp_data(template, device.groups["sfps"])
+        if "product_info" in device.groups:
+            self.init_product_info(template, self.named_fields(device, "product_info"))
+
+        return template
+
+    def _clone_slave_context(self, template) -> ModbusSlaveContext:
+        """Create a copy-on-write slave context from a template"""
+        return ModbusSlaveContext(
+            di=template.store["d"].clone(),
+            co=template.store["c"].clone(),
+            hr=template.store["h"].clone(),
+            ir=template.store["i"].clone(),
+            zero_mode=template.zero_mode,
+        )
+
+    @staticmethod
+    def device_key(device):
+        """Identify a device across configuration reloads"""
+        return device.endpoint, device.device_id
+
+    def _group_endpoints(self, register_map):
+        """Collect the devices served on every distinct endpoint"""
+        endpoints = {}
+
+        for device in register_map.devices:
+            entry = endpoints.setdefault(
+                device.endpoint, {"baudrate": device.baudrate, "devices": []}
+            )
+            if device.transport == "rtu" and entry["baudrate"] != device.baudrate:
+                raise ValueError(
+                    f"{device.endpoint[1]} is configured with baudrates "
+                    f"{entry['baudrate']} and {device.baudrate}"
+                )
+            entry["devices"].append(device)
 
-        for device in self.config["modbus_devices"]:
-            device_id = device["device_id"]
+        return endpoints
 
-            if device_id not in [1, 2]:
-                continue
+    def _setup_server_contexts(self):
+        """Setup a server context per endpoint with an isolated slave per device"""
+        return {
+            endpoint: self._new_server_context(endpoint, entry["devices"])
+            for endpoint, entry in self.endpoints.items()
+        }
 
-            # Initialize device data
-            if "registers" in device:
-                if device_id == 1 and "sfps" in device["registers"]:
-                    self.init_sfp_data(slave_context, device["registers"]["sfps"])
-                elif device_id == 2 and "product_info" in device["registers"]:
-                    self.init_product_info(
-                        slave_context, device["registers"]["product_info"]
-                    )
+    def _new_server_context(self, endpoint, devices):
+        """Create the server context of an endpoint"""
+        if self.lazy:
+            server_context = LazyServerContext(
+                partial(self._materialize, endpoint),
+                max_active=self.max_active,
+                on_evict=partial(self._evicted, endpoint),
+            )
+        else:
+            server_context = ModbusServerContext(slaves={}, single=False)
+
+        for device in devices:
+            self._add_device(server_context, device)
+        return server_context
+
+    def _add_device(self, server_context, device):
+        """Add a device to a server context, deferring its creation if lazy"""
+        if isinstance(server_context, LazyServerContext):
+            server_context.configure(device.device_id)
+            return
+        context = self._create_device_context(device)
+        server_context[device.device_id] = context
+        self._activate(device, context)
+
+    def _materialize(self, endpoint, device_id):
+        """Create the slave context of a device on its first request"""
+        device = self.device_index[(endpoint, device_id)]
+        context = self._create_device_context(device)
+        self._call_on_updater(self._activate, device, context)
+        return context
+
+    def _evicted(self, endpoint, device_id, context):
+        """Stop updating the slave context of an evicted device"""
+        device = self.device_index[(endpoint, device_id)]
+        self._call_on_updater(self._deactivate, device, context)
+
+    def _call_on_updater(self, callback, *args):
+        """Run a callback of a request on the thread running the updates
+
+        Requests are served on the event loop, the updates run on the updater
+        thread unless --asyncio is set. Changing the scheduled updates and
+        the engines from the event loop would race with their iteration.
+        """
+        if self.engine == "compute" and self.replayer is None:
+            # Computed fields are only ever touched by requests
+            callback(*args)
+        else:
+            self.scheduler.call_soon(partial(callback, *args))
+
+    def _activate(self, device, context):
+        """Start updating the values of a device's slave context"""
+        if self.replayer is not None:
+            # Recorded values replace the simulated ones
+            self.replayer.attach(device.bus, device.device_id, context)
+            return
+        if self.engine == "compute":
+            self._add_computed_fields(device, context.store["h"])
+            return
+
+        self.device_tasks[self.device_key(device)] = self._schedule_device(
+            device, context
+        )
+        if self.engine == "numpy" and "sfps" in device.groups:
+            timing = device.update["sfps"]
+            if timing not in self.sfp_engines:
+                # One vectorized engine per distinct update timing
+                self.sfp_engines[timing] = NumpyFloatUpdater(
+                    self._stream_seed("numpy", timing)
+                )
+                self.scheduler.add(self.sfp_engines[timing].update, *timing)
+            self._add_sfp_points(
+                self.sfp_engines[timing],
+                context,
+                self.sfp_points(device.groups["sfps"], device.params, device.noise),
+            )
+
+    def _deactivate(self, device, context):
+        """Stop updating the values of a device's slave context"""
+        if self.replayer is not None:
+            self.replayer.detach(device.bus, device.device_id)
+        for task in self.device_tasks.pop(self.device_key(device), []):
+            self.scheduler.cancel(task)
+        for sfp_engine in self.sfp_engines.values():
+            sfp_engine.remove(context)
+        if isinstance(context.store["h"], ComputedDataBlock):
+            context.store["h"].clear()
+
+    def _add_computed_fields(self, device, block):
+        """Compute the simulated values of a device when they are read"""
+        if "sfps" in device.groups:
+            period, phase, _ = device.update["sfps"]
+            points = self.sfp_points(device.groups["sfps"], device.params, device.noise)
+            # Quantum k of every SFP value reads sample k of the device's stream
+            bank = self._noise_bank(device, points)
+            for index, (sfp_field, _, _) in enumerate(points):
+                block.add(
+                    sfp_field.address,
+                    sfp_field.count,
+                    partial(self._sample, sfp_field.codec, bank, index),
+                    period,
+                    phase,
+                )
 
-            contexts[device_id] = slave_context
+        if "product_info" in device.groups:
+            period, phase, _ = device.update["product_info"]
+            values = {
+                "product_number": device.params.get("product_number", "PROD-12"),
+                "serial_number": device.params.get("serial_number", "SN-Q10"),
+            }
+            for name, register_field in self.named_fields(device, "product_info").items():
+                if name in values:
+                    block.add(
+                        register_field.address,
+                        register_field.count,
+                        partial(self._constant, register_field.codec.encode(values[name])),
+                        period,
+                        phase,
+                    )
 
-        return ModbusServerContext(slaves=contexts, single=False)
+    @staticmethod
+    def _sample(codec, bank, index, quantum):
+        """Encode a value of the sample of a time quantum"""
+        return codec.encode(float(bank.sample(quantum)[index]))
+
+    @staticmethod
+    def _constant(registers, quantum):
+        """Return registers that do not change over time"""
+        return registers
+
+    def _stream_seed(self, *key):
+        """Derive the seed of a noise stream from the simulator seed, or None"""
+        return None if self.seed is None else stream_seed(self.seed, *key)
+
+    def _noise_bank(self, device, points):
+        """Create the noise stream of a device's SFP values"""
+        if "seed" in device.params:
+            seed = stream_seed(device.params["seed"])
+        else:
+            seed = self._stream_seed(device.endpoint, device.device_id)
+
+        bank = NoiseBank(seed)
+        for _, base, noise in points:
+            bank.add(base, noise)
+        return bank
+
+    def _active_context(self, device):
+        """Return the slave context of a device without creating it, or None"""
+        server_context = self.contexts.get(device.endpoint)
+        if server_context is None:
+            return None
+        if isinstance(server_context, LazyServerContext):
+            return server_context.peek(device.device_id)
+        if device.device_id in server_context:
+            return server_context[device.device_id]
+        return None
+
+    def _create_device_context(self, device) -> ModbusSlaveContext:
+        """Clone a device's slave context from its register map template"""
+        # Devices with identical register maps share one template
+        key = device.template_key
+        if key not in self.templates:
+            self.templates[key] = self._create_template(device)
+        context = self._clone_slave_context(self.templates[key])
+        self._apply_params(context, device)
+        if self.engine == "compute":
+            context.store["h"] = ComputedDataBlock(context.store["h"])
+        return context
+
+    def _apply_params(self, context, device):
+        """Write the initial values of a device's own parameters"""
+        params = device.params
+        for sfp_field in device.groups.get("sfps", ()):
+            if sfp_field.name in params:
+                self.write_value(context, sfp_field, params[sfp_field.name])
+
+        for name, register_field in self.named_fields(device, "product_info").items():
+            if name in params:
+                self.write_value(context, register_field, params[name])
+
+    def device_context(self, device) -> ModbusSlaveContext:
+        """Return the slave context of a configured device"""
+        return self.contexts[device.endpoint][device.device_id]
+
+    @staticmethod
+    def named_fields(device, group):
+        """Return the fields of a register group keyed by name"""
+        return {
+            register_field.name: register_field
+            for register_field in device.groups.get(group, ())
+        }
 
     def init_sfp_data(self, context, sfps):
         """Initialize SFP data with base values"""
         sfp_base_values = {
-            1: {"tx": 3.0, "rx": 0.1},
-            2: {"tx": 3.0, "rx": 0.1},
-            3: {"tx": 3.0, "rx": 0.1},
-            4: {"tx": 3.0, "rx": 0.1},
+            1: {"tx_power": 3.0, "rx_power": 0.1, "temperature": 25.0},
+            2: {"tx_power": 3.0, "rx_power": 0.1, "temperature": 25.0},
+            3: {"tx_power": 3.0, "rx_power": 0.1, "temperature": 25.0},
+            4: {"tx_power": 3.0, "rx_power": 0.1, "temperature": 25.0},
         }
 
-        for sfp in sfps:
-            sfp_id = sfp["sfp"]
-            if sfp_id in sfp_base_values:
-                base = sfp_base_values[sfp_id]
-                self.write_float(context, sfp["tx_power"]["address"], base["tx"])
-                self.write_float(context, sfp["rx_power"]["address"], base["rx"])
-                self.write_float(context, sfp["temperature"]["address"], 25.0)
+        for sfp_field in sfps:
+            base = sfp_base_values.get(sfp_field.key[1], {})
+            if sfp_field.name in base:
+                self.write_value(context, sfp_field, base[sfp_field.name])
+
+    @staticmethod
+    def sfp_points(sfps, params=None, noise=None):
+        """Return (field, base value, NoiseSpec) of every simulated SFP value
+
+        Base values in ``params`` and noise in ``noise`` apply to every SFP of
+        the device.
+        """
+        params = params or {}
+        noise = noise or {}
+        points = []
+        for sfp_field in sfps:
+            base = params.get(
+                sfp_field.name, SFP_BASE_VALUES.get(sfp_field.key[1], {}).get(sfp_field.name)
+            )
+            if base is None:
+                continue
+            if sfp_field.name in noise:
+                points.append((sfp_field, base, noise[sfp_field.name]))
+            elif sfp_field.name in SFP_VARIATION:
+                points.append(
+                    (sfp_field, base, NoiseSpec(spread=SFP_VARIATION[sfp_field.name]))
+                )
+        return points
+
+    def update_sfp_values(self, slave_context, points, bank):
+        """Write the next sample of a device's noise stream to its SFP values"""
+        for (sfp_field, _, _), value in zip(points, bank.next()):
+            self.write_value(slave_context, sfp_field, float(value))
+
+    def _schedule_device(self, device, slave_context):
+        """Schedule the value updates of a device and return the tasks
+
+        With the NumPy engine the SFP values are left to the shared engines.
+        """
+        tasks = []
+
+        if "sfps" in device.groups and self.engine != "numpy":
+            points = self.sfp_points(device.groups["sfps"], device.params, device.noise)
+            tasks.append(
+                self.scheduler.add(
+                    partial(
+                        self.update_sfp_values,
+                        slave_context,
+                        points,
+                        self._noise_bank(device, points),
+                    ),
+                    *device.update["sfps"],
+                )
+            )
 
-    def update_sfp_values(self, slave_context, sfps):
-        """Update SFP values with specified variations"""
-        sfp_base_values = {
-            1: {"tx": 3.0, "rx": 0.07},
-            2: {"tx": 3.0, "rx": 0.07},
-            3: {"tx": 3.0, "rx": 0.07},
-            4: {"tx": 3.0, "rx": 0.07},
-        }
+        if "product_info" in device.groups:
+            tasks.append(
+                self.scheduler.add(
+                    partial(
+                        self.update_product_info,
+                        slave_context,
+                        self.named_fields(device, "product_info"),
+                        device.params.get("product_number", "PROD-12"),
+                        device.params.get("serial_number", "SN-Q10"),
+                    ),
+                    *device.update["product_info"],
+                )
+            )
+
+        return tasks
 
-        for sfp in sfps:
-            sfp_num = sfp["sfp"]
-            if sfp_num in sfp_base_values:
-                base = sfp_base_values[sfp_num]
-
-                # Add random variations
-                tx_power = base["tx"] + random.uniform(-0.05, 0.05)
-                rx_power = base["rx"] + random.uniform(-0.03, 0.03)
-                temperature = 25.0 + random.uniform(-1, 1)
-
-                # Write values to registers
-                self.write_float(slave_context, sfp["tx_power"]["address"], tx_power)
-                self.write_float(slave_context, sfp["rx_power"]["address"], rx_power)
-                self.write_float(
-                    slave_context, sfp["temperature"]["address"], temperature
+    @staticmethod
+    def _add_sfp_points(engine, slave_context, points):
+        """Register the SFP values of a device with a NumPy updater"""
+        for sfp_field, base, noise in points:
+            if sfp_field.codec is not FLOAT32:
+                raise ValueError(
+                    f"{sfp_field.key}: the numpy engine only supports big-endian float32"
                 )
-                
-        log.info(f"=== Completed SFP update at {time.strftime('%Y-%m-%d %H:%M:%S')} === ")
+            engine.add(slave_context, sfp_field.address, base, noise)
 
     def init_product_info(self, context, product_info):
         # Write sample product and serial numbers
         if "product_number" in product_info:
-            self.write_string(
-                context,
-                product_info["product_number"]["address"],
-                "PROD123456",
-                product_info["product_number"]["length"],
-            )
+            self.write_value(context, product_info["product_number"], "PROD123456")
 
         if "serial_number" in product_info:
-            self.write_string(
-                context,
-                product_info["serial_number"]["address"],
-                "SN987654321",
-                product_info["serial_number"]["length"],
-            )
+            self.write_value(context, product_info["serial_number"], "SN987654321")
 
     def update_product_info(
         self, slave_context, product_info, product_number, serial_number
     ):
         """Update product info registers with provided values"""
         if "product_number" in product_info:
-            self.write_string(
-                slave_context,
-                product_info["product_number"]["address"],
-                product_number,
-                product_info["product_number"]["length"],
+            self.write_value(
+                slave_context, product_info["product_number"], product_number
             )
 
         if "serial_number" in product_info:
-            self.write_string(
-                slave_context,
-                product_info["serial_number"]["address"],
-                serial_number,
-                product_info["serial_number"]["length"],
-            )
-        log.info("=== Completed Product Info update ===")
+            self.write_value(slave_context, product_info["serial_number"], serial_number)
+
+    def write_value(self, context, register_field, value):
+        """Encode a value with the field's codec and write it"""
+        context.setValues(3, register_field.address, register_field.codec.encode(value))
 
     def write_float(self, context, address, value):
         """Write a float value to the specified address"""
-        builder = BinaryPayloadBuilder(byteorder=Endian.BIG, wordorder=Endian.BIG)
-        builder.add_32bit_float(value)
-        registers = builder.to_registers()
-        context.setValues(3, address, registers)
+        context.setValues(3, address, FLOAT32.encode(value))
 
     def write_string(self, context, address, value, length):
-        # Pad string to specified length
-        padded_value = value.ljust(length, "\0")
-        # Convert to bytes and then to registers (2 bytes per register)
-        bytes_value = padded_value.encode("ascii")
-        registers = [
-            struct.unpack(">H", bytes_value[i : i + 2])[0]
-            for i in range(0, len(bytes_value), 2)
-        ]
-        context.setValues(3, address, registers)
+        """Write a null padded ASCII string to the specified address"""
+        context.setValues(3, address, get_codec("string", length).encode(value))
 
     def update_values(self):
         """Periodically update all values to simulate real-time changes"""
-        counter = 0
-        while True:
-            for device in self.config["modbus_devices"]:
-                device_id = device["device_id"]
-
-                if device_id not in [1, 2]:
+        self.scheduler.run_forever()
+
+    def request_reload(self, *_):
+        """Reload the configuration on the next check, safe in signal handlers"""
+        self._reload_requested = True
+
+    def check_config(self):
+        """Reload the configuration when requested or when the file changed"""
+        if self.watch_interval:
+            try:
+                mtime = os.stat(self.config_file).st_mtime_ns
+            except OSError:
+                mtime = self.config_mtime
+            if mtime != self.config_mtime:
+                self.config_mtime = mtime
+                self._reload_requested = True
+
+        if self._reload_requested:
+            self._reload_requested = False
+            self.reload_config()
+
+    def reload_config(self):
+        """Apply changes of the configuration file without restarting
+
+        Devices whose register map changed get a new slave context that keeps
+        the values of their unchanged fields. Untouched devices keep their
+        context, devices with new update timing are rescheduled, and servers
+        are started or stopped for added or removed endpoints.
+        """
+        try:
+            register_map = load_register_map(self.config_file)
+            endpoints = self._group_endpoints(register_map)
+        except (OSError, yaml.YAMLError, ValueError) as exc:
+            log.error("Keeping the current configuration, reload failed: %s", exc)
+            return False
+        except Exception:
+            # The compiler should reject every invalid file with a
+            # RegisterMapError, anything else is a bug worth a traceback
+            log.exception("Keeping the current configuration, reload failed")
+            return False
+
+        old_devices = self.device_index
+        new_devices = {
+            self.device_key(device): device for device in register_map.devices
+        }
+        self.register_map = register_map
+        self.device_index = new_devices
+        self.endpoints = endpoints
+
+        for key in old_devices.keys() - new_devices.keys():
+            context = self._active_context(old_devices[key])
+            if context is not None:
+                self._deactivate(old_devices[key], context)
+            endpoint, device_id = key
+            del self.contexts[endpoint][device_id]
+
+        changed = 0
+        for key, device in new_devices.items():
+            old_device = old_devices.get(key)
+            context = self._active_context(old_device) if old_device else None
+
+            if old_device is not None and old_device.template_key == device.template_key:
+                if (old_device.params, old_device.update, old_device.noise) == (
+                    device.params,
+                    device.update,
+                    device.noise,
+                ):
                     continue
+                if context is not None:
+                    if old_device.params != device.params:
+                        self._apply_params(context, device)
+                    self._deactivate(old_device, context)
+                    self._activate(device, context)
+            elif context is not None:
+                new_context = self._create_device_context(device)
+                self._copy_unchanged_fields(old_device, device, context, new_context)
+                if old_device.params != device.params:
+                    self._apply_params(new_context, device)
+                self._deactivate(old_device, context)
+                self.contexts[device.endpoint][device.device_id] = new_context
+                self._activate(device, new_context)
+            else:
+                # New devices, and changed ones that were never addressed
+                if device.endpoint not in self.contexts:
+                    self.contexts[device.endpoint] = self._new_server_context(
+                        device.endpoint, []
+                    )
+                self._add_device(self.contexts[device.endpoint], device)
+            changed += 1
+
+        for endpoint in self.contexts.keys() - self.endpoints.keys():
+            del self.contexts[endpoint]
+
+        used = {device.template_key for device in new_devices.values()}
+        for template_key in self.templates.keys() - used:
+            del self.templates[template_key]
+
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self._sync_servers(), self.loop)
+
+        removed = len(old_devices.keys() - new_devices.keys())
+        log.info(
+            "Reloaded %s: %d device(s) added or changed, %d removed",
+            self.config_file,
+            changed,
+            removed,
+            extra={"changed": changed, "removed": removed},
+        )
+        return True
+
+    @staticmethod
+    def _copy_unchanged_fields(old_device, device, old_context, context):
+        """Carry the values of fields present in both versions of a device"""
+        for register_field in set(old_device.fields).intersection(device.fields):
+            context.setValues(
+                3,
+                register_field.address,
+                old_context.getValues(3, register_field.address, register_field.count),
+            )
 
-                slave_context = self.context[device_id]
-
-                if "registers" in device:
-                    # Update SFP values every second for device 1
-                    if device_id == 1 and "sfps" in device["registers"]:
-                        self.update_sfp_values(
-                            slave_context, device["registers"]["sfps"]
-                        )
-
-                    # Update product info every 5 seconds for device 2
-                    elif (
-                        device_id == 2
-                        and counter % 10 == 0
-                        and "product_info" in device["registers"]
-                    ):
-                        self.update_product_info(
-                            slave_context,
-                            device["registers"]["product_info"],
-                            "PROD-12",
-                            "SN-Q10",
-                        )
-
-            counter += 1
-            time.sleep(1)  # Update every second
-
-    def start_server(self):
-        """Start Modbus RTU server for device_id 2"""
-        for device in self.config["modbus_devices"]:
-            device_id = device["device_id"]
-
-            if device_id not in [1, 2]:
+    @staticmethod
+    def _identity(device):
+        """Build the device identification reported by the server"""
+        identity = ModbusDeviceIdentification()
+        identity.VendorName = "Simulator"
+        identity.ProductCode = f"Device{device.device_id}"
+        identity.ModelName = device.description
+        return identity
+
+    def start_server(self, use_asyncio=False):
+        """Start a Modbus server for every configured endpoint
+
+        Started from the main thread, SIGHUP reloads the configuration.
+        Embedded simulators running in other threads reload with
+        ``watch_interval`` instead.
+        """
+        if (
+            hasattr(signal, "SIGHUP")
+            and threading.current_thread() is threading.main_thread()
+        ):
+            signal.signal(signal.SIGHUP, self.request_reload)
+
+        if use_asyncio:
+            asyncio.run(self.start_async_server())
+            return
+
+        # Start update thread for dynamic values
+        update_thread = threading.Thread(target=self.update_values, daemon=True)
+        update_thread.start()
+
+        asyncio.run(self.serve_endpoints())
+
+    async def start_async_server(self):
+        """Serve requests and update values as tasks on one event loop"""
+        updater = asyncio.create_task(self.scheduler.run_async())
+        try:
+            await self.serve_endpoints()
+        finally:
+            updater.cancel()
+
+    def _create_server(self, endpoint, entry):
+        """Create the pymodbus server for an endpoint"""
+        transport, target = endpoint
+        context = self.contexts[endpoint]
+        framer = TRANSPORT_FRAMERS[transport]
+        # The first device on an endpoint provides the server identity
+        options = {"framer": framer, "identity": self._identity(entry["devices"][0])}
+        if self.metrics is not None:
+            options["request_tracer"] = partial(self._trace_request, endpoint)
+            options["response_manipulator"] = partial(self._measure_response, endpoint)
+
+        if transport == "rtu":
+            return ModbusSerialServer(
+                context, port=target, baudrate=entry["baudrate"], **options
+            )
+        if transport == "udp":
+            return ModbusUdpServer(context, address=target, **options)
+        return ModbusTcpServer(context, address=target, **options)
+
+    async def serve_endpoints(self):
+        """Serve every configured serial port and socket concurrently"""
+        self.loop = asyncio.get_running_loop()
+        try:
+            await self._sync_servers()
+            await asyncio.Future()
+        finally:
+            for server in self.servers.values():
+                await server.shutdown()
+            self.servers = {}
+            self.loop = None
+
+    async def _sync_servers(self):
+        """Start and stop servers to match the configured endpoints"""
+        for endpoint in list(self.servers):
+            if endpoint not in self.endpoints:
+                log.info("Stopping %s server on %s", *endpoint)
+                await self.servers.pop(endpoint).shutdown()
+
+        for endpoint, entry in self.endpoints.items():
+            if endpoint in self.servers:
                 continue
-
-            identity = ModbusDeviceIdentification()
-            identity.VendorName = "Simulator"
-            identity.ProductCode = f"Device{device_id}"
-            identity.ModelName = device.get("description", f"Device {device_id}")
-
-            # Start update thread for dynamic values
-            update_thread = threading.Thread(target=self.update_values, daemon=True)
-            update_thread.start()
-
-            # Start server
-            StartSerialServer(
-                context=self.context,
-                identity=identity,
-                port="/dev/pts/7",
-                baudrate=device["baudrate"],
+            server = self._create_server(endpoint, entry)
+            self.servers[endpoint] = server
+            log.info(
+                "Serving %d device(s) over %s on %s",
+                len(entry["devices"]),
+                *endpoint,
+                extra={"devices": len(entry["devices"])},
             )
+            task = asyncio.create_task(server.serve_forever())
+            task.add_done_callback(self._server_done)
+
+    @staticmethod
+    def _server_done(task):
+        """Log servers that stopped because of an error"""
+        if not task.cancelled() and task.exception() is not None:
+            log.error("Server stopped: %r", task.exception())
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Modbus RTU simulator")
+    parser.add_argument(
+        "--asyncio",
+        action="store_true",
+        help="run the value updates as tasks on the server's event loop",
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        metavar="SECONDS",
+        help="reload the configuration when the file changes, checked at this interval",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("python", "numpy", "compute"),
+        default="python",
+        help="how the simulated values are refreshed, compute only does so on read",
+    )
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="create the registers of a device on the first request addressed to it",
+    )
+    parser.add_argument(
+        "--max-active",
+        type=int,
+        metavar="N",
+        help="with --lazy, drop the least recently addressed devices beyond N per endpoint",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="DIR",
+        help="replay a trace recorded with the client's --record instead of noise",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="replay the trace at this multiple of real time",
+    )
+    parser.add_argument(
+        "--loop",
+        action="store_true",
+        help="start the trace over when it ends",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="seed the noise of every device for reproducible traces",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="serve request and update metrics on http://127.0.0.1:PORT/metrics",
+    )
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging_from_args(args)
+    metrics = MetricsRegistry() if args.metrics_port else None
+
     # Create and start simulator
-    simulator = ModbusRTUSimulator("modbus_register_configuration.yaml")
+    simulator = ModbusRTUSimulator(
+        "modbus_register_configuration.yaml",
+        engine=args.engine,
+        watch_interval=args.watch,
+        lazy=args.lazy,
+        max_active=args.max_active,
+        seed=args.seed,
+        trace=args.replay,
+        speed=args.speed,
+        loop=args.loop,
+        metrics=metrics,
+    )
+    if metrics is not None:
+        start_http_server(metrics, args.metrics_port)
 
     try:
         print("Starting Modbus RTU simulator...")
         print("Press Ctrl+C to stop")
-        simulator.start_server()
+        simulator.start_server(use_asyncio=args.asyncio)
     except KeyboardInterrupt:
         print("\nStopping simulator...")
@@ -0,0 +1,225 @@
+from array import array
+from bisect import bisect_right
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+
+
+log = logging.getLogger(__name__)
+
+# Column layout of a trace directory, see TraceRecorder
+TRACE_VERSION = 1
+META_FILE = "meta.json"
+
+
+def _column_struct(count):
+    """Record of one column: a float64 timestamp and ``count`` registers"""
+    return struct.Struct(f"<d{count}H")
+
+
+def _bus_key(bus):
+    """Restore the (transport, target) tuple of a bus stored as JSON"""
+    transport, target = bus
+    return transport, tuple(target) if isinstance(target, list) else target
+
+
+class TraceRecorder:
+    """Append register values read from devices to a columnar trace
+
+    A trace is a directory with one file per field. Every file holds
+    fixed-size little-endian records of a timestamp and the raw registers of
+    the field, so columns can be appended independently and memory-mapped
+    for replay. ``meta.json`` lists the columns and is rewritten whenever
+    one is added. Recording into an existing trace appends to it, after
+    dropping a record an interrupted recording cut short.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.columns = []
+        self._index = {}
+        self._files = {}
+
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.columns = json.load(f)["columns"]
+            for index, column in enumerate(self.columns):
+                key = (
+                    _bus_key(column["bus"]),
+                    column["device_id"],
+                    column["address"],
+                    column["count"],
+                )
+                self._index[key] = index
+
+    def _column(self, bus, device_id, register_field):
+        """Return the index of a field's column, adding it if needed"""
+        key = (bus, device_id, register_field.address, register_field.count)
+        index = self._index.get(key)
+        if index is None:
+            index = len(self.columns)
+            self.columns.append(
+                {
+                    "bus": list(bus),
+                    "device_id": device_id,
+                    "key": list(register_field.key),
+                    "address": register_field.address,
+                    "count": register_field.count,
+                    "file": f"c{index}.bin",
+                }
+            )
+            self._index[key] = index
+            self._write_meta()
+        return index
+
+    def _write_meta(self):
+        """Store the column list atomically"""
+        meta_path = os.path.join(self.path, META_FILE)
+        with open(f"{meta_path}.tmp", "w") as f:
+            json.dump({"version": TRACE_VERSION, "columns": self.columns}, f, indent=1)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def record(self, bus, device_id, block, registers, timestamp=None):
+        """Append the fields of a block read from a device"""
+        timestamp = time.time() if timestamp is None else timestamp
+        for register_field in block.fields:
+            index = self._column(bus, device_id, register_field)
+            record = _column_struct(register_field.count)
+            if index not in self._files:
+                self._files[index] = self._open(index, record.size)
+            self._files[index].write(
+                record.pack(timestamp, *block.slice(registers, register_field))
+            )
+
+    def _open(self, index, record_size):
+        """Open a column file for appending whole records"""
+        column_path = os.path.join(self.path, self.columns[index]["file"])
+        f = open(column_path, "ab")
+        # Appending after a partial record would shift every later record
+        size = f.tell()
+        if size % record_size:
+            log.warning(
+                "Dropping %d bytes of a partial record at the end of %s",
+                size % record_size,
+                column_path,
+            )
+            f.truncate(size - size % record_size)
+        return f
+
+    def flush(self):
+        """Write the buffered records to disk"""
+        for f in self._files.values():
+            f.flush()
+
+    def close(self):
+        """Flush and close every column file"""
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+
+class TraceColumn:
+    """Read access to one memory-mapped column of a trace"""
+
+    def __init__(self, path, column):
+        self.bus = _bus_key(column["bus"])
+        self.device_id = column["device_id"]
+        self.address = column["address"]
+        self.count = column["count"]
+        self.record = _column_struct(self.count)
+
+        with open(os.path.join(path, column["file"]), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        # Ignore a record cut short by an interrupted recording
+        self.length = size // self.record.size
+
+    def __len__(self):
+        """Number of records"""
+        return self.length
+
+    def __getitem__(self, index):
+        """Timestamp of a record, lets bisect search the column"""
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return struct.unpack_from("<d", self.data, index * self.record.size)[0]
+
+    def registers(self, index):
+        """Registers of a record"""
+        offset = index * self.record.size + 8
+        registers = array("H", self.data[offset : offset + self.count * 2])
+        if sys.byteorder == "big":
+            registers.byteswap()
+        return registers
+
+
+class TraceReplayer:
+    """Stream a recorded trace into slave contexts at ``speed`` times real time
+
+    Every update writes the latest record of each attached column whose
+    timestamp has been reached. Records in between are skipped, so replaying
+    at high speed costs the same per update as replaying at 1x. With
+    ``loop`` set the trace starts over when it ends, otherwise the last
+    values are kept.
+    """
+
+    def __init__(self, path, speed=1.0, loop=False, clock=time.monotonic):
+        if speed <= 0:
+            raise ValueError("speed must be positive")
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        if meta.get("version") != TRACE_VERSION:
+            raise ValueError(f"{path}: unsupported trace version {meta.get('version')}")
+
+        self.columns = [TraceColumn(path, column) for column in meta["columns"]]
+        self.columns = [column for column in self.columns if len(column)]
+        self.speed = speed
+        self.loop = loop
+        self.clock = clock
+        self.start = None
+
+        self.begin = min((column[0] for column in self.columns), default=0.0)
+        self.end = max((column[len(column) - 1] for column in self.columns), default=0.0)
+
+        self._by_device = {}
+        for column in self.columns:
+            self._by_device.setdefault((column.bus, column.device_id), []).append(column)
+        # Slave context and last written record of every attached column
+        self._targets = {}
+
+    def attach(self, bus, device_id, context):
+        """Replay the columns of a device into its slave context"""
+        for column in self._by_device.get((bus, device_id), ()):
+            self._targets[column] = [context, -1]
+
+    def detach(self, bus, device_id):
+        """Stop replaying into a device"""
+        for column in self._by_device.get((bus, device_id), ()):
+            self._targets.pop(column, None)
+
+    def trace_time(self):
+        """Timestamp of the trace that is replayed now"""
+        now = self.clock()
+        if self.start is None:
+            self.start = now
+        elapsed = (now - self.start) * self.speed
+        if self.loop and self.end > self.begin:
+            elapsed %= self.end - self.begin
+        return self.begin + elapsed
+
+    def update(self):
+        """Write the records that were reached since the last update"""
+        timestamp = self.trace_time()
+        for column, target in self._targets.items():
+            context, last = target
+            index = bisect_right(column, timestamp) - 1
+            if index < 0 or index == last:
+                continue
+            context.setValues(3, column.address, column.registers(index))
+            target[1] = index
@@ -0,0 +1,74 @@
+import unittest
+
+from modbus_changes import ChangeDetector
+from modbus_codec import FLOAT32
+from modbus_read_planner import plan_reads
+from modbus_register_map import compile_device
+
+
+DEVICE = {
+    "device_id": 1,
+    "com_port": "/dev/null",
+    "registers": {
+        "sfps": [
+            {
+                "sfp": 1,
+                "rx_power": {"address": 1000, "datatype": "float32"},
+                "tx_power": {"address": 1002, "datatype": "float32"},
+            }
+        ]
+    },
+    "deadband": {"rx_power": 0.5},
+}
+
+RX_POWER = ("sfps", 1, "rx_power")
+TX_POWER = ("sfps", 1, "tx_power")
+
+
+class ChangeDetectorTest(unittest.TestCase):
+    def setUp(self):
+        self.device = compile_device(DEVICE)
+        (self.block,) = plan_reads(self.device.fields)
+        self.detector = ChangeDetector()
+
+    def changes(self, rx_power, tx_power):
+        registers = FLOAT32.encode(rx_power) + FLOAT32.encode(tx_power)
+        return self.detector.changes(self.device, self.block, registers)
+
+    def test_first_read_is_reported(self):
+        self.assertEqual(self.changes(-3.0, 1.0), {RX_POWER: -3.0, TX_POWER: 1.0})
+
+    def test_unchanged_read_is_skipped(self):
+        self.changes(-3.0, 1.0)
+        self.assertEqual(self.changes(-3.0, 1.0), {})
+
+    def test_only_changed_fields(self):
+        self.changes(-3.0, 1.0)
+        self.assertEqual(self.changes(-3.0, 1.25), {TX_POWER: 1.25})
+
+    def test_deadband(self):
+        self.changes(-3.0, 1.0)
+        self.assertEqual(self.changes(-3.25, 1.0), {})
+        self.assertEqual(self.changes(-2.5, 1.0), {})
+        self.assertEqual(self.changes(-2.25, 1.0), {RX_POWER: -2.25})
+
+    def test_deadband_is_relative_to_last_report(self):
+        # Small steps that add up past the deadband are reported once
+        self.changes(-3.0, 1.0)
+        self.assertEqual(self.changes(-2.75, 1.0), {})
+        self.assertEqual(self.changes(-2.5, 1.0), {})
+        self.assertEqual(self.changes(-2.25, 1.0), {RX_POWER: -2.25})
+        self.assertEqual(self.changes(-2.0, 1.0), {})
+
+    def test_devices_are_tracked_separately(self):
+        other = compile_device({**DEVICE, "device_id": 2})
+        registers = FLOAT32.encode(-3.0) + FLOAT32.encode(1.0)
+        self.detector.changes(self.device, self.block, registers)
+        self.assertEqual(
+            self.detector.changes(other, self.block, registers),
+            {RX_POWER: -3.0, TX_POWER: 1.0},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
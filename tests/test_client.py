@@ -0,0 +1,119 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from pymodbus.exceptions import ConnectionException
+from pymodbus.pdu import ExceptionResponse, ModbusExceptions
+from pymodbus.pdu.register_read_message import ReadHoldingRegistersResponse
+import yaml
+
+from modbus_client import AsyncModbusRTUClient, ModbusRTUClient
+from modbus_codec import FLOAT32
+from modbus_datablock import SegmentedDataBlock
+
+
+# Three SFP values with unused registers between them
+DEVICE = {
+    "device_id": 1,
+    "transport": "tcp",
+    "server_address": "127.0.0.1:15020",
+    "registers": {
+        "sfps": [
+            {
+                "sfp": 1,
+                "rx_power": {"address": 1000, "datatype": "float32"},
+                "tx_power": {"address": 1004, "datatype": "float32"},
+                "temperature": {"address": 1008, "datatype": "float32"},
+            }
+        ]
+    },
+}
+
+VALUES = {
+    ("sfps", 1, "rx_power"): -3.0,
+    ("sfps", 1, "tx_power"): 1.5,
+    ("sfps", 1, "temperature"): 40.0,
+}
+
+
+class FakeDevice:
+    """Answers reads like a device that only has the declared registers"""
+
+    def __init__(self):
+        self.block = SegmentedDataBlock([(1000, 2), (1004, 2), (1008, 2)])
+        for address, value in zip((1000, 1004, 1008), VALUES.values()):
+            self.block.setValues(address, FLOAT32.encode(value))
+        self.requests = []
+
+    def read(self, address, count):
+        self.requests.append((address, count))
+        if not self.block.validate(address, count):
+            return ExceptionResponse(0x03, ModbusExceptions.IllegalAddress)
+        return ReadHoldingRegistersResponse(self.block.getValues(address, count))
+
+
+class SyncClient:
+    def __init__(self, device):
+        self.device = device
+
+    def read_holding_registers(self, address, count=1, slave=1):
+        if self.device is None:
+            raise ConnectionException("not connected")
+        return self.device.read(address, count)
+
+
+class AsyncClient(SyncClient):
+    async def read_holding_registers(self, address, count=1, slave=1):
+        return super().read_holding_registers(address, count, slave)
+
+
+class SplitReadTest(unittest.TestCase):
+    def setUp(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        self.path = os.path.join(workdir, "devices.yaml")
+        with open(self.path, "w") as f:
+            yaml.safe_dump({"modbus_devices": [DEVICE]}, f)
+        self.device = FakeDevice()
+
+    def test_sync_client(self):
+        client = ModbusRTUClient(self.path)
+        client.client = SyncClient(self.device)
+        bus = client.register_map.devices[0].bus
+        with self.assertLogs("modbus_client", "INFO"):
+            self.assertEqual(client.read_device(bus, 1), VALUES)
+        self.assertEqual(self.device.requests[0], (1000, 10))
+
+        # The split reads replace the rejected block
+        self.device.requests.clear()
+        self.assertEqual(client.read_device(bus, 1), VALUES)
+        self.assertEqual(self.device.requests, [(1000, 2), (1004, 2), (1008, 2)])
+
+    def test_async_client(self):
+        client = AsyncModbusRTUClient(self.path)
+        bus = client.register_map.devices[0].bus
+        client.clients = {bus: AsyncClient(self.device)}
+        with self.assertLogs("modbus_client", "INFO"):
+            self.assertEqual(asyncio.run(client.read_device(bus, 1)), VALUES)
+
+        self.device.requests.clear()
+        self.assertEqual(asyncio.run(client.read_device(bus, 1)), VALUES)
+        self.assertEqual(self.device.requests, [(1000, 2), (1004, 2), (1008, 2)])
+
+    def test_failed_reads(self):
+        sync_client = ModbusRTUClient(self.path)
+        sync_client.client = SyncClient(None)
+        async_client = AsyncModbusRTUClient(self.path)
+        bus = async_client.register_map.devices[0].bus
+        async_client.clients = {bus: AsyncClient(None)}
+
+        with self.assertLogs("modbus_client", "WARNING"):
+            self.assertEqual(sync_client.read_device(bus, 1), {})
+        with self.assertLogs("modbus_client", "WARNING"):
+            self.assertEqual(asyncio.run(async_client.read_device(bus, 1)), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import itertools
+import math
+import unittest
+
+from modbus_codec import DATATYPES, get_codec
+
+
+ORDERS = list(itertools.product(("big", "little"), repeat=2))
+
+# A value of every numeric datatype that survives the round trip exactly
+VALUES = {
+    "int16": -1234,
+    "uint16": 0xBEEF,
+    "int32": -123456789,
+    "uint32": 0xDEADBEEF,
+    "float32": 1.5,
+    "float64": math.pi,
+}
+
+
+class RegisterCodecTest(unittest.TestCase):
+    def test_round_trip(self):
+        for datatype, (byteorder, wordorder) in itertools.product(DATATYPES, ORDERS):
+            with self.subTest(datatype, byteorder=byteorder, wordorder=wordorder):
+                codec = get_codec(datatype, byteorder=byteorder, wordorder=wordorder)
+                registers = codec.encode(VALUES[datatype])
+                self.assertEqual(len(registers), codec.count)
+                self.assertEqual(codec.decode(registers), VALUES[datatype])
+
+    def test_round_trip_many(self):
+        for datatype, (byteorder, wordorder) in itertools.product(DATATYPES, ORDERS):
+            with self.subTest(datatype, byteorder=byteorder, wordorder=wordorder):
+                codec = get_codec(datatype, byteorder=byteorder, wordorder=wordorder)
+                values = [VALUES[datatype]] * 3
+                registers = codec.encode_many(values)
+                self.assertEqual(registers, codec.encode(values[0]) * 3)
+                self.assertEqual(codec.decode_many(registers), values)
+
+    def test_string_round_trip(self):
+        for byteorder, wordorder in ORDERS:
+            with self.subTest(byteorder=byteorder, wordorder=wordorder):
+                codec = get_codec("string", 5, byteorder, wordorder)
+                registers = codec.encode("abcde")
+                self.assertEqual(len(registers), 3)
+                self.assertEqual(codec.decode(registers), "abcde")
+                self.assertEqual(codec.decode(codec.encode("ab")), "ab")
+
+    def test_float32_encoding(self):
+        expected = {
+            ("big", "big"): [0x4040, 0x0000],
+            ("little", "big"): [0x4040, 0x0000],
+            ("big", "little"): [0x0000, 0x4040],
+            ("little", "little"): [0x0000, 0x4040],
+        }
+        for (byteorder, wordorder), registers in expected.items():
+            with self.subTest(byteorder=byteorder, wordorder=wordorder):
+                codec = get_codec("float32", byteorder=byteorder, wordorder=wordorder)
+                self.assertEqual(codec.encode(3.0), registers)
+                self.assertEqual(codec.decode(registers), 3.0)
+
+    def test_int32_encoding(self):
+        # Unlike 3.0, the bytes of every register differ, so swapping shows
+        expected = {
+            ("big", "big"): [0x0102, 0x0304],
+            ("little", "big"): [0x0201, 0x0403],
+            ("big", "little"): [0x0304, 0x0102],
+            ("little", "little"): [0x0403, 0x0201],
+        }
+        for (byteorder, wordorder), registers in expected.items():
+            with self.subTest(byteorder=byteorder, wordorder=wordorder):
+                codec = get_codec("int32", byteorder=byteorder, wordorder=wordorder)
+                self.assertEqual(codec.encode(0x01020304), registers)
+
+    def test_string_encoding(self):
+        self.assertEqual(get_codec("string", 3).encode("abc"), [0x6162, 0x6300])
+        self.assertEqual(
+            get_codec("string", 3, byteorder="little").encode("abc"), [0x6261, 0x0063]
+        )
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            get_codec("float16")
+        with self.assertRaises(ValueError):
+            get_codec("string")
+
+
+if __name__ == "__main__":
+    unittest.main()
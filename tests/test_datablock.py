@@ -0,0 +1,150 @@
+import asyncio
+import unittest
+
+from pymodbus.datastore import ModbusSlaveContext
+from pymodbus.exceptions import ParameterException
+from pymodbus.pdu import ExceptionResponse, ModbusExceptions
+from pymodbus.pdu.register_read_message import ReadHoldingRegistersRequest
+
+from modbus_datablock import CompactDataBlock, ComputedDataBlock, SegmentedDataBlock
+
+
+def read(context, address, count):
+    """Serve a read holding registers request like the server does"""
+    request = ReadHoldingRegistersRequest(address, count)
+    return asyncio.run(request.update_datastore(context))
+
+
+class SegmentedDataBlockTest(unittest.TestCase):
+    def setUp(self):
+        # 1000-1005 and 1010-1011, padded by one register: 999-1006, 1009-1012
+        self.block = SegmentedDataBlock([(1000, 6), (1010, 2)], padding=1)
+
+    def test_merges_and_pads_ranges(self):
+        self.assertEqual(self.block.starts, [999, 1009])
+        self.assertEqual([len(segment) for segment in self.block.segments], [8, 4])
+        self.assertEqual(len(SegmentedDataBlock([(0, 4), (4, 4)]).segments), 1)
+
+    def test_validate(self):
+        self.assertTrue(self.block.validate(999, 8))
+        self.assertTrue(self.block.validate(1010, 2))
+        self.assertFalse(self.block.validate(998, 1))
+        self.assertFalse(self.block.validate(1005, 5))  # spans the gap
+        self.assertFalse(self.block.validate(1012, 2))
+        self.assertFalse(self.block.validate(1000, 0))
+
+    def test_values(self):
+        self.block.setValues(1003, [7, 8])
+        self.block.setValues(1010, 9)
+        self.assertEqual(self.block.getValues(1002, 4), [0, 7, 8, 0])
+        self.assertEqual(self.block.getValues(1010, 1), [9])
+
+    def test_unallocated_write(self):
+        with self.assertRaises(ParameterException):
+            self.block.setValues(1006, [1, 2])
+
+    def test_server_answers_illegal_address(self):
+        context = ModbusSlaveContext(hr=self.block, zero_mode=True)
+        self.assertEqual(read(context, 1000, 6).registers, [0] * 6)
+
+        response = read(context, 1000, 12)
+        self.assertIsInstance(response, ExceptionResponse)
+        self.assertEqual(response.exception_code, ModbusExceptions.IllegalAddress)
+
+
+class CloneTest(unittest.TestCase):
+    def blocks(self):
+        return [
+            CompactDataBlock(0, 16),
+            SegmentedDataBlock([(0, 4), (10, 4)]),
+        ]
+
+    def test_writes_to_a_clone_stay_in_it(self):
+        for block in self.blocks():
+            with self.subTest(type(block).__name__):
+                block.setValues(1, [5])
+                clone = block.clone()
+                clone.setValues(1, [6])
+                self.assertEqual(block.getValues(1, 1), [5])
+                self.assertEqual(clone.getValues(1, 1), [6])
+
+    def test_writes_to_the_source_stay_in_it(self):
+        for block in self.blocks():
+            with self.subTest(type(block).__name__):
+                clone = block.clone()
+                block.setValues(1, [5])
+                self.assertEqual(clone.getValues(1, 1), [0])
+                self.assertEqual(block.getValues(1, 1), [5])
+
+    def test_buffer_writes_copy_first(self):
+        for block in self.blocks():
+            with self.subTest(type(block).__name__):
+                clone = block.clone()
+                values, offset = clone.buffer(2)
+                values[offset] = 9
+                self.assertEqual(block.getValues(2, 1), [0])
+                self.assertEqual(clone.getValues(2, 1), [9])
+
+    def test_storage_is_shared_until_written(self):
+        block = SegmentedDataBlock([(0, 4), (10, 4)])
+        clone = block.clone()
+        self.assertEqual(clone.nbytes, 0)
+        clone.setValues(10, [1])
+        # Only the written segment is copied
+        self.assertEqual(clone.nbytes, 8)
+        self.assertIs(clone.segments[0], block.segments[0])
+
+
+class ComputedDataBlockTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.quanta = []
+        self.block = ComputedDataBlock(CompactDataBlock(0, 16), lambda: self.now)
+        self.block.add(4, 2, self.compute, period=1.0, phase=0.5)
+
+    def compute(self, quantum):
+        self.quanta.append(quantum)
+        return [quantum, quantum + 100]
+
+    def test_computed_once_per_quantum(self):
+        self.assertEqual(self.block.getValues(4, 2), [0, 0])
+        for now in (0.5, 0.9, 1.5, 1.6, 3.7):
+            self.now = now
+            self.block.getValues(4, 2)
+        self.assertEqual(self.quanta, [0, 1, 3])
+        self.assertEqual(self.block.getValues(4, 2), [3, 103])
+
+    def test_only_reads_touching_a_field_compute_it(self):
+        self.now = 0.5
+        self.block.getValues(0, 4)
+        self.block.getValues(6, 4)
+        self.assertEqual(self.quanta, [])
+        self.assertEqual(self.block.getValues(5, 1), [100])
+
+    def test_writes_last_until_the_next_quantum(self):
+        self.now = 0.5
+        self.block.setValues(4, [7])
+        self.assertEqual(self.block.getValues(4, 1), [0])
+        self.block.setValues(4, [7])
+        self.assertEqual(self.block.getValues(4, 1), [7])
+        self.now = 1.5
+        self.assertEqual(self.block.getValues(4, 1), [1])
+
+    def test_reset_recomputes(self):
+        self.now = 0.5
+        self.block.getValues(4, 2)
+        self.block.reset()
+        self.assertEqual(self.block.getValues(4, 2), [0, 100])
+        self.assertEqual(self.quanta, [0, 0])
+
+    def test_clear_keeps_the_last_values(self):
+        self.now = 0.5
+        self.block.getValues(4, 2)
+        self.block.clear()
+        self.now = 1.5
+        self.assertEqual(self.block.getValues(4, 2), [0, 100])
+        self.assertEqual(self.quanta, [0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import logging
+import unittest
+
+from modbus_logging import RateLimitFilter, SamplingFilter
+
+
+def record(msg, *args, level=logging.INFO, name="test"):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+class RateLimitFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.filter = RateLimitFilter(rate=2.0, burst=3, clock=lambda: self.now)
+
+    def test_burst_then_rate(self):
+        passed = [self.filter.filter(record("poll %d", n)) for n in range(5)]
+        self.assertEqual(passed, [True, True, True, False, False])
+        self.now = 0.5
+        resumed = record("poll %d", 5)
+        self.assertTrue(self.filter.filter(resumed))
+        self.assertEqual(resumed.suppressed, 2)
+        self.assertFalse(self.filter.filter(record("poll %d", 6)))
+
+    def test_messages_are_limited_separately(self):
+        for _ in range(3):
+            self.filter.filter(record("poll"))
+        self.assertFalse(self.filter.filter(record("poll")))
+        self.assertTrue(self.filter.filter(record("poll", level=logging.WARNING)))
+        self.assertTrue(self.filter.filter(record("other")))
+
+    def test_state_is_bounded(self):
+        limited = RateLimitFilter(burst=1, clock=lambda: self.now, max_messages=10)
+        for n in range(100):
+            self.assertTrue(limited.filter(record(f"poll {n}")))
+        self.assertEqual(len(limited._buckets), 10)
+        # Recently logged messages keep their bucket
+        self.assertFalse(limited.filter(record("poll 99")))
+
+
+class SamplingFilterTest(unittest.TestCase):
+    def test_one_in_every(self):
+        sampling = SamplingFilter(every=3)
+        passed = [sampling.filter(record("poll %d", n)) for n in range(7)]
+        self.assertEqual(passed, [True, False, False, True, False, False, True])
+
+    def test_above_level_always_passes(self):
+        sampling = SamplingFilter(every=3)
+        for _ in range(3):
+            self.assertTrue(sampling.filter(record("failed", level=logging.WARNING)))
+
+    def test_state_is_bounded(self):
+        sampling = SamplingFilter(every=2, max_messages=10)
+        for n in range(100):
+            self.assertTrue(sampling.filter(record(f"poll {n}")))
+        self.assertEqual(len(sampling._seen), 10)
+        self.assertFalse(sampling.filter(record("poll 99")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+from urllib.request import urlopen
+import unittest
+
+from modbus_metrics import (
+    CONTENT_TYPE,
+    MetricsRegistry,
+    endpoint_label,
+    start_http_server,
+)
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter(self):
+        counter = self.registry.counter("requests_total", "Requests", ["endpoint"])
+        counter.inc("tcp:127.0.0.1:5020")
+        counter.inc("tcp:127.0.0.1:5020", amount=2)
+        self.assertEqual(
+            self.registry.render(),
+            "# HELP requests_total Requests\n"
+            "# TYPE requests_total counter\n"
+            'requests_total{endpoint="tcp:127.0.0.1:5020"} 3\n',
+        )
+
+    def test_gauge_function(self):
+        self.registry.gauge("active", "Active", ["endpoint"], lambda: {("a",): 1.5})
+        self.registry.gauge("devices", "Devices", function=lambda: 4)
+        lines = self.registry.render().splitlines()
+        self.assertIn('active{endpoint="a"} 1.5', lines)
+        self.assertIn("devices 4", lines)
+
+    def test_histogram(self):
+        histogram = self.registry.histogram("lag", "Lag", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 2.0):
+            histogram.observe(value)
+        self.assertEqual(
+            self.registry.render().splitlines()[2:],
+            [
+                'lag_bucket{le="0.1"} 1',
+                'lag_bucket{le="1.0"} 3',
+                'lag_bucket{le="+Inf"} 4',
+                "lag_sum 3.05",
+                "lag_count 4",
+            ],
+        )
+
+    def test_escapes_label_values(self):
+        self.registry.counter("errors", "Errors", ["message"]).inc('a "b"\\\n')
+        self.assertIn('errors{message="a \\"b\\"\\\\\\n"} 1', self.registry.render())
+
+    def test_shared_by_name(self):
+        counter = self.registry.counter("requests_total", "Requests")
+        self.assertIs(self.registry.counter("requests_total", "Requests"), counter)
+        with self.assertRaises(ValueError):
+            self.registry.gauge("requests_total", "Requests")
+
+    def test_endpoint_label(self):
+        self.assertEqual(
+            endpoint_label(("tcp", ("127.0.0.1", 5020))), "tcp:127.0.0.1:5020"
+        )
+        self.assertEqual(endpoint_label(("rtu", "/dev/pts/3")), "rtu:/dev/pts/3")
+
+    def test_http_server(self):
+        self.registry.counter("requests_total", "Requests").inc()
+        server = start_http_server(self.registry, 0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        with urlopen(f"http://127.0.0.1:{server.server_port}/metrics") as response:
+            self.assertEqual(response.headers["Content-Type"], CONTENT_TYPE)
+            self.assertEqual(response.read().decode(), self.registry.render())
+
+
+if __name__ == "__main__":
+    unittest.main()
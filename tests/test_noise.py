@@ -0,0 +1,159 @@
+from unittest import mock
+import itertools
+import unittest
+
+from modbus_noise import NoiseBank, NoiseSpec, noise_spec
+import modbus_noise
+
+
+BACKENDS = ["python"] + (["numpy"] if modbus_noise.np is not None else [])
+
+
+def backend(name):
+    """Patch modbus_noise to draw with a backend"""
+    if name == "numpy":
+        return mock.patch.object(modbus_noise, "np", modbus_noise.np)
+    return mock.patch.object(modbus_noise, "np", None)
+
+
+def rng_state(bank):
+    """State of the generator of a NoiseBank"""
+    if hasattr(bank.rng, "bit_generator"):
+        return bank.rng.bit_generator.state
+    return bank.rng.getstate()
+
+
+def fault_runs(samples, base):
+    """Lengths of the runs of faulted samples, without one still running"""
+    runs = [
+        len(list(run))
+        for faulted, run in itertools.groupby(value != base for value in samples)
+        if faulted
+    ]
+    if samples and samples[-1] != base:
+        runs.pop()
+    return runs
+
+
+class NoiseBankTest(unittest.TestCase):
+    def draw(self, specs, count, seed=7, batch=8):
+        bank = NoiseBank(seed, batch)
+        for base, spec in specs:
+            bank.add(base, spec)
+        return [list(map(float, bank.next())) for _ in range(count)]
+
+    def test_reproducible(self):
+        specs = [(1.0, NoiseSpec(spread=0.5, sigma=0.1, walk=0.01))] * 3
+        for name in BACKENDS:
+            with self.subTest(backend=name), backend(name):
+                self.assertEqual(self.draw(specs, 50), self.draw(specs, 50))
+                self.assertNotEqual(self.draw(specs, 50), self.draw(specs, 50, seed=8))
+
+    def test_drift(self):
+        for name in BACKENDS:
+            with self.subTest(backend=name), backend(name):
+                samples = self.draw([(10.0, NoiseSpec(drift=0.5))], 20)
+                self.assertEqual(samples, [[10.0 + 0.5 * n] for n in range(1, 21)])
+
+    def test_permanent_fault(self):
+        spec = NoiseSpec(fault_probability=1.0, fault_offset=-10.0)
+        for name in BACKENDS:
+            with self.subTest(backend=name), backend(name):
+                samples = self.draw([(1.0, spec)], 20)
+                self.assertEqual({row[0] for row in samples}, {-9.0})
+
+    def test_fault_carries_over_batches(self):
+        # Faults last ten samples, longer than a batch, so most of them
+        # start in one batch and end in a later one
+        spec = NoiseSpec(fault_probability=0.02, fault_offset=100.0, fault_duration=10)
+        for name in BACKENDS:
+            with self.subTest(backend=name), backend(name):
+                samples = [row[0] for row in self.draw([(0.0, spec)], 5000, batch=4)]
+                self.assertEqual(set(samples), {0.0, 100.0})
+                runs = fault_runs(samples, 0.0)
+                self.assertTrue(runs)
+                self.assertGreaterEqual(min(runs), 10)
+
+    def test_columns_are_independent(self):
+        specs = [
+            (0.0, NoiseSpec(fault_probability=1.0, fault_offset=1.0)),
+            (5.0, NoiseSpec()),
+        ]
+        for name in BACKENDS:
+            with self.subTest(backend=name), backend(name):
+                self.assertEqual(self.draw(specs, 3), [[1.0, 5.0]] * 3)
+
+    def test_sample_skips_like_next(self):
+        # sample() skips whole batches, it must return what calling next()
+        # until the index was reached returns
+        specs = [(1.0, NoiseSpec(spread=0.5, walk=0.1, fault_probability=0.1))] * 2
+        indices = [0, 0, 3, 4, 20, 19, 21, 100, 357, 358, 1000]
+        for name in BACKENDS:
+            with self.subTest(backend=name), backend(name):
+                skipping = NoiseBank(3, batch=16)
+                stepping = NoiseBank(3, batch=16)
+                for base, spec in specs:
+                    skipping.add(base, spec)
+                    stepping.add(base, spec)
+                for index in indices:
+                    while stepping.sample_index <= index:
+                        stepping.next()
+                    self.assertEqual(
+                        list(skipping.sample(index)), list(stepping._last), index
+                    )
+
+    def test_values_added_and_removed_later(self):
+        drift = NoiseSpec(drift=1.0)
+        for name in BACKENDS:
+            with self.subTest(backend=name), backend(name):
+                bank = NoiseBank(7, batch=1)
+                bank.add(0.0, NoiseSpec(spread=0.5))
+                bank.add(0.0, drift)
+                samples = [list(map(float, bank.next())) for _ in range(3)]
+                self.assertEqual([row[1] for row in samples], [1.0, 2.0, 3.0])
+
+                # The drift of a value starts when it is added, the others
+                # carry on
+                self.assertEqual(bank.add(10.0, drift), 2)
+                self.assertEqual(list(map(float, bank.next()))[1:], [4.0, 11.0])
+                bank.remove([0, 2])
+                self.assertEqual(list(map(float, bank.next())), [5.0])
+
+    def test_models_that_are_off_draw_nothing(self):
+        for name in BACKENDS:
+            with self.subTest(backend=name), backend(name):
+                bank = NoiseBank(7, batch=4)
+                bank.add(1.0, NoiseSpec(drift=0.5))
+                state = rng_state(bank)
+                self.assertEqual([float(bank.next()[0]) for _ in range(2)], [1.5, 2.0])
+                self.assertEqual(rng_state(bank), state)
+
+    def test_values_added_later_skip_drawn_samples(self):
+        bank = NoiseBank(7, batch=8)
+        bank.add(0.0, NoiseSpec(drift=1.0))
+        bank.next()
+        bank.add(0.0, NoiseSpec())
+        self.assertEqual(bank.sample_index, 8)
+        self.assertEqual(list(map(float, bank.next())), [9.0, 0.0])
+
+
+class NoiseSpecTest(unittest.TestCase):
+    def test_from_yaml(self):
+        spec = noise_spec({"sigma": 0.02, "fault": {"probability": 0.1, "duration": 3}})
+        self.assertEqual(
+            spec, NoiseSpec(sigma=0.02, fault_probability=0.1, fault_duration=3)
+        )
+
+    def test_rejects_invalid(self):
+        for entry in (
+            {"sigm": 1.0},
+            {"fault": {"offst": 1.0}},
+            {"spread": -1.0},
+            {"fault": {"duration": 0}},
+        ):
+            with self.subTest(entry=entry), self.assertRaises(ValueError):
+                noise_spec(entry)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from pymodbus.datastore import ModbusSlaveContext
+
+from modbus_codec import FLOAT32
+from modbus_datablock import CompactDataBlock
+from modbus_noise import NoiseSpec
+import modbus_numpy_engine
+
+
+@unittest.skipIf(modbus_numpy_engine.np is None, "numpy is not installed")
+class NumpyFloatUpdaterTest(unittest.TestCase):
+    def context(self):
+        return ModbusSlaveContext(hr=CompactDataBlock(0, 16), zero_mode=True)
+
+    def value(self, context, address):
+        return FLOAT32.decode(context.getValues(3, address, 2))
+
+    def test_devices_added_and_removed_later(self):
+        engine = modbus_numpy_engine.NumpyFloatUpdater(seed=1)
+        first, second = self.context(), self.context()
+        engine.add(first, 0, 0.0, NoiseSpec(drift=1.0))
+        for _ in range(3):
+            engine.update()
+        self.assertEqual(self.value(first, 0), 3.0)
+
+        # The first device carries on instead of starting over
+        engine.add(second, 4, 10.0, NoiseSpec(drift=1.0))
+        engine.update()
+        self.assertEqual((self.value(first, 0), self.value(second, 4)), (4.0, 11.0))
+
+        engine.remove(first)
+        engine.update()
+        self.assertEqual((self.value(first, 0), self.value(second, 4)), (4.0, 12.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+from modbus_codec import get_codec
+from modbus_read_planner import plan_reads, split_block
+from modbus_register_map import RegisterField
+
+
+FLOAT32 = get_codec("float32")
+
+
+def fields(*addresses, count=2):
+    """float32 fields at the given addresses"""
+    return [
+        RegisterField(("sfps", address), "sfps", "value", address, count, FLOAT32)
+        for address in addresses
+    ]
+
+
+def ranges(blocks):
+    return [(block.address, block.count) for block in blocks]
+
+
+class PlanReadsTest(unittest.TestCase):
+    def test_merges_adjacent_fields(self):
+        self.assertEqual(ranges(plan_reads(fields(1004, 1000, 1002))), [(1000, 6)])
+
+    def test_max_gap(self):
+        spread = fields(1000, 1004, 1020)
+        self.assertEqual(ranges(plan_reads(spread)), [(1000, 2), (1004, 2), (1020, 2)])
+        self.assertEqual(ranges(plan_reads(spread, max_gap=2)), [(1000, 6), (1020, 2)])
+        self.assertEqual(ranges(plan_reads(spread, max_gap=16)), [(1000, 22)])
+
+    def test_max_registers(self):
+        blocks = plan_reads(fields(*range(0, 300, 2)))
+        self.assertEqual(ranges(blocks), [(0, 124), (124, 124), (248, 52)])
+
+    def test_fields_are_decoded_from_their_block(self):
+        (block,) = plan_reads(fields(1000, 1004), max_gap=2)
+        registers = FLOAT32.encode(1.5) + [0, 0] + FLOAT32.encode(-2.0)
+        self.assertEqual(
+            block.decode(registers), {("sfps", 1000): 1.5, ("sfps", 1004): -2.0}
+        )
+
+
+class SplitBlockTest(unittest.TestCase):
+    def test_splits_at_gaps(self):
+        (block,) = plan_reads(fields(1000, 1002, 1008), max_gap=8)
+        self.assertEqual(ranges(split_block(block)), [(1000, 4), (1008, 2)])
+
+    def test_splits_contiguous_fields(self):
+        (block,) = plan_reads(fields(1000, 1002, 1004))
+        self.assertEqual(ranges(split_block(block)), [(1000, 2), (1002, 2), (1004, 2)])
+
+    def test_single_field(self):
+        (block,) = plan_reads(fields(1000))
+        self.assertEqual(split_block(block), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
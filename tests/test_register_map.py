@@ -0,0 +1,179 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from modbus_register_map import (
+    RegisterMapError,
+    compile_device,
+    compile_fleet,
+    compile_register_map,
+    load_register_map,
+)
+
+
+CONFIG = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "modbus_register_configuration.yaml",
+)
+
+
+def device(**entries):
+    """A network device entry with one SFP"""
+    return {
+        "device_id": 1,
+        "transport": "tcp",
+        "server_address": "127.0.0.1:5020",
+        "registers": {
+            "sfps": [
+                {
+                    "sfp": 1,
+                    "rx_power": {"address": 1000, "datatype": "float32"},
+                    "tx_power": {"address": 1002, "datatype": "float32"},
+                }
+            ]
+        },
+        **entries,
+    }
+
+
+class CompileDeviceTest(unittest.TestCase):
+    def test_compile(self):
+        compiled = compile_device(device(update={"sfps": {"period": 0.5}}))
+        self.assertEqual(compiled.endpoint, ("tcp", ("127.0.0.1", 5020)))
+        self.assertEqual(compiled.bus, compiled.endpoint)
+        self.assertEqual(
+            [field.key for field in compiled.groups["sfps"]],
+            [("sfps", 1, "rx_power"), ("sfps", 1, "tx_power")],
+        )
+        self.assertEqual(compiled.fields[1].address, 1002)
+        self.assertEqual(compiled.update["sfps"], (0.5, 0.0, 0.0))
+
+    def test_client_address(self):
+        compiled = compile_device(device(client_address="10.0.0.1:502"))
+        self.assertEqual(compiled.bus, ("tcp", ("10.0.0.1", 502)))
+
+    def test_rejects_invalid(self):
+        overlapping = {"address": 1001, "datatype": "uint16"}
+        out_of_range = {"address": 65535, "datatype": "uint32"}
+        for entries in (
+            {"device_id": "1"},
+            {"transport": "serial"},
+            {"server_address": "localhost"},
+            {"registers": {"sfps": [{"sfp": 1, "rx_power": {"address": 1000}}]}},
+            {"registers": {"status": {"uptime": out_of_range}}},
+            {"registers": {"status": {"uptime": {"address": 1, "datatype": "int8"}}}},
+            {"registers": {"sfps": [{"rx_power": overlapping}]}},
+            {"registers": {"sfps": [{"sfp": 1, "port": 2, "rx_power": overlapping}]}},
+            {"registers": {**device()["registers"], "status": {"bias": overlapping}}},
+            {"update": {"sfps": {"period": 0}}},
+            {"poll": {"sfps": {"priority": "high"}}},
+            {"params": {"colour": "red"}},
+            {"noise": {"rx_power": {"sigm": 1.0}}},
+            {"deadband": {"voltage": 0.1}},
+            {"deadband": {"rx_power": -1}},
+        ):
+            with self.subTest(entries=entries), self.assertRaises(RegisterMapError):
+                compile_device(device(**entries))
+
+    def test_rtu_needs_a_com_port(self):
+        with self.assertRaisesRegex(RegisterMapError, "com_port"):
+            compile_device(device(transport="rtu"))
+
+    def test_rtu_baudrate(self):
+        serial = device(transport="rtu", com_port="/dev/pts/3")
+        self.assertEqual(compile_device(serial).baudrate, 9600)
+        serial_115200 = compile_device({**serial, "baudrate": 115200})
+        self.assertEqual(serial_115200.baudrate, 115200)
+        self.assertIsNone(compile_device(device()).baudrate)
+        with self.assertRaises(RegisterMapError):
+            compile_device({**serial, "baudrate": "fast"})
+
+
+def fleet(**entries):
+    """A fleet of slaves 1-3 of the test device on two ports"""
+    template = device(params={"serial_number": "SN{device_id:04d}"})
+    del template["device_id"]
+    return {
+        "template": template,
+        "device_ids": [1, 3],
+        "buses": [
+            {"server_address": "127.0.0.1:5020"},
+            {"server_address": "127.0.0.1:5021"},
+        ],
+        **entries,
+    }
+
+
+class CompileFleetTest(unittest.TestCase):
+    def test_expands_every_bus(self):
+        devices = compile_fleet(fleet(overrides={2: {"tx_power": -3.0}}))
+        self.assertEqual(
+            [(device.endpoint[1][1], device.device_id) for device in devices],
+            [(5020, 1), (5020, 2), (5020, 3), (5021, 1), (5021, 2), (5021, 3)],
+        )
+        self.assertEqual(
+            devices[1].params, {"serial_number": "SN0002", "tx_power": -3.0}
+        )
+        self.assertEqual(devices[2].params, {"serial_number": "SN0003"})
+        self.assertEqual(devices[0].description, "Device 1")
+        # Instances on a bus share the compiled template
+        self.assertIs(devices[0].fields, devices[2].fields)
+
+    def test_rejects_invalid(self):
+        for entries in (
+            {"template": None},
+            {"device_ids": [1]},
+            {"device_ids": [0, 3]},
+            {"device_ids": [3, 1]},
+            {"device_ids": [1, 248]},
+            {"overrides": {4: {"tx_power": 1.0}}},
+            {"overrides": {1: {"colour": "red"}}},
+            {"params": {"serial_number": "SN{id}"}},
+            {"buses": {"server_address": "127.0.0.1:5020"}},
+        ):
+            with self.subTest(entries=entries), self.assertRaises(RegisterMapError):
+                compile_fleet(fleet(**entries))
+
+    def test_rejects_duplicate_ids(self):
+        config = {"modbus_devices": [device(device_id=2)], "fleets": [fleet()]}
+        with self.assertRaisesRegex(RegisterMapError, "device 2 is configured twice"):
+            compile_register_map(config)
+
+
+class RegisterMapCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.cache_dir = os.path.join(self.workdir, "cache")
+
+    def config(self, name, comment=""):
+        path = os.path.join(self.workdir, name)
+        shutil.copy(CONFIG, path)
+        with open(path, "a") as f:
+            f.write(f"\n# {comment}\n")
+        return path
+
+    def test_cached_map_is_loaded(self):
+        path = self.config("devices.yaml")
+        compiled = load_register_map(path, self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        self.assertEqual(load_register_map(path, self.cache_dir), compiled)
+
+    def test_old_versions_are_removed(self):
+        path = self.config("devices.yaml")
+        other = self.config("devices.backup.yaml")
+        load_register_map(path, self.cache_dir)
+        load_register_map(other, self.cache_dir)
+        for version in range(3):
+            self.config("devices.yaml", f"version {version}")
+            load_register_map(path, self.cache_dir)
+
+        entries = os.listdir(self.cache_dir)
+        self.assertEqual(len(entries), 2)
+        backups = [entry for entry in entries if entry.startswith("devices.backup.")]
+        self.assertEqual(len(backups), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
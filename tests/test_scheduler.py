@@ -0,0 +1,126 @@
+import unittest
+
+from modbus_scheduler import PollScheduler, UpdateScheduler
+
+
+class FakeClock:
+    """A monotonic clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class UpdateSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = UpdateScheduler(self.clock, seed=1)
+        self.runs = []
+
+    def add(self, name, period, phase=0.0, jitter=0.0):
+        return self.scheduler.add(lambda: self.runs.append(name), period, phase, jitter)
+
+    def test_runs_due_tasks(self):
+        self.add("fast", 1.0)
+        self.add("slow", 3.0, phase=0.5)
+        for now in (0.0, 0.5, 1.0, 2.0, 3.0, 3.5):
+            self.clock.now = now
+            self.scheduler.run_pending()
+        self.assertEqual(self.runs, ["fast", "slow", "fast", "fast", "fast", "slow"])
+
+    def test_skips_missed_ticks(self):
+        self.add("task", 1.0)
+        self.scheduler.run_pending()
+        self.clock.now = 5.5
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.scheduler.next_due(), 6.0)
+
+    def test_jitter_does_not_accumulate(self):
+        task = self.add("task", 1.0, jitter=0.25)
+        for tick in range(100):
+            due = self.scheduler.next_due()
+            self.assertLessEqual(abs(due - tick), 0.25)
+            self.clock.now = max(due, self.clock.now)
+            self.scheduler.run_pending()
+        self.assertEqual(task.nominal, 100.0)
+
+    def test_cancel(self):
+        task = self.add("task", 1.0)
+        self.scheduler.cancel(task)
+        self.assertEqual(self.scheduler.run_pending(), 0)
+        self.assertIsNone(self.scheduler.next_due())
+
+    def test_failing_task_stays_scheduled(self):
+        def fail():
+            raise RuntimeError("boom")
+
+        self.scheduler.add(fail, 1.0)
+        self.add("other", 1.0)
+        with self.assertLogs("modbus_scheduler", "ERROR"):
+            self.assertEqual(self.scheduler.run_pending(), 2)
+        self.clock.now = 1.0
+        with self.assertLogs("modbus_scheduler", "ERROR"):
+            self.assertEqual(self.scheduler.run_pending(), 2)
+        self.assertEqual(self.runs, ["other", "other"])
+
+    def test_on_run(self):
+        observed = []
+        self.scheduler.on_run = lambda task, lag, duration: observed.append(lag)
+        self.add("task", 1.0)
+        self.clock.now = 0.25
+        self.scheduler.run_pending()
+        self.assertEqual(observed, [0.25])
+
+    def test_call_soon(self):
+        self.scheduler.call_soon(lambda: self.runs.append("soon"))
+        self.add("task", 1.0)
+        self.scheduler.run_pending()
+        self.scheduler.run_pending()
+        self.assertEqual(self.runs, ["soon", "task"])
+
+    def test_rejects_non_positive_period(self):
+        with self.assertRaises(ValueError):
+            self.add("task", 0.0)
+
+
+class PollSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = PollScheduler(self.clock)
+
+    def test_earliest_deadline_first(self):
+        self.scheduler.add("slow", 10.0)
+        self.scheduler.add("fast", 1.0)
+        self.scheduler.add("urgent", 1.0, priority=5)
+        self.scheduler.add("later", 1.0, phase=0.5)
+        due = self.scheduler.pop_due()
+        self.assertEqual([job.key for job in due], ["urgent", "fast", "slow"])
+
+    def test_complete_releases_again(self):
+        job = self.scheduler.add("job", 2.0)
+        self.scheduler.pop_due()
+        self.assertFalse(self.scheduler.complete(job, finished=1.0))
+        self.assertEqual(self.scheduler.delay(), 2.0)
+        self.assertEqual(self.scheduler.pop_due(), [])
+        self.clock.now = 2.0
+        self.assertEqual(self.scheduler.pop_due(), [job])
+
+    def test_missed_deadline(self):
+        job = self.scheduler.add("job", 1.0)
+        self.scheduler.pop_due()
+        self.assertTrue(self.scheduler.complete(job, finished=3.5))
+        self.assertEqual(self.scheduler.missed, 1)
+        # The releases that were missed are skipped
+        self.assertEqual(job.release, 4.0)
+
+    def test_once(self):
+        job = self.scheduler.add("job")
+        self.assertEqual(self.scheduler.pop_due(), [job])
+        self.assertFalse(self.scheduler.complete(job))
+        self.assertIsNone(self.scheduler.delay())
+
+
+if __name__ == "__main__":
+    unittest.main()
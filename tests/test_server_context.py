@@ -0,0 +1,71 @@
+import unittest
+
+from pymodbus.exceptions import NoSuchSlaveException
+
+from modbus_server_context import LazyServerContext
+
+
+class LazyServerContextTest(unittest.TestCase):
+    def setUp(self):
+        self.created = []
+        self.evicted = []
+        self.context = LazyServerContext(
+            self.factory, slave_ids=(1, 2, 3), max_active=2, on_evict=self.on_evict
+        )
+
+    def factory(self, slave):
+        self.created.append(slave)
+        return f"context {slave} #{self.created.count(slave)}"
+
+    def on_evict(self, slave, context):
+        self.evicted.append((slave, context))
+
+    def test_created_on_first_request(self):
+        self.assertIn(3, self.context)
+        self.assertEqual(self.context.active(), [])
+        self.assertEqual(self.context[3], "context 3 #1")
+        self.assertEqual(self.context[3], "context 3 #1")
+        self.assertEqual(self.created, [3])
+
+    def test_unknown_slave(self):
+        self.assertNotIn(4, self.context)
+        with self.assertRaises(NoSuchSlaveException):
+            self.context[4]
+
+    def test_evicts_least_recently_used(self):
+        self.context[1]
+        self.context[2]
+        self.context[1]
+        self.context[3]
+        self.assertEqual(self.evicted, [(2, "context 2 #1")])
+        self.assertEqual(self.context.active(), [1, 3])
+
+        # Evicted slaves are created again from the factory
+        self.assertEqual(self.context[2], "context 2 #2")
+        self.assertEqual(self.evicted[-1], (1, "context 1 #1"))
+
+    def test_peek_does_not_create(self):
+        self.assertIsNone(self.context.peek(1))
+        self.context[1]
+        self.assertEqual(self.context.peek(1), "context 1 #1")
+
+    def test_set_and_delete(self):
+        self.context[4] = "preset"
+        self.assertEqual(self.context[4], "preset")
+        self.assertEqual(self.context.slaves(), [1, 2, 3, 4])
+
+        self.context[1]
+        del self.context[1]
+        self.assertNotIn(1, self.context)
+        # Removed slaves are not evicted
+        self.assertNotIn(1, [slave for slave, _ in self.evicted])
+
+    def test_configure(self):
+        self.context.configure(200)
+        self.assertIn(200, self.context)
+        with self.assertRaises(NoSuchSlaveException):
+            self.context.configure(248)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+from unittest import mock
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import unittest
+
+from pymodbus.exceptions import NoSuchSlaveException
+import yaml
+
+from modbus_codec import FLOAT32
+from modbus_simulator import ModbusRTUSimulator
+
+
+def device(device_id, port=15020, tx_power_address=1002):
+    """A network device with one SFP"""
+    return {
+        "device_id": device_id,
+        "transport": "tcp",
+        "server_address": f"127.0.0.1:{port}",
+        "registers": {
+            "sfps": [
+                {
+                    "sfp": 1,
+                    "rx_power": {"address": 1000, "datatype": "float32"},
+                    "tx_power": {"address": tx_power_address, "datatype": "float32"},
+                }
+            ]
+        },
+    }
+
+
+class SimulatorTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.path = os.path.join(self.workdir, "devices.yaml")
+
+    def write(self, *devices):
+        with open(self.path, "w") as f:
+            yaml.safe_dump({"modbus_devices": list(devices)}, f)
+
+    def simulator(self, *devices):
+        self.write(*devices)
+        return ModbusRTUSimulator(self.path)
+
+
+class ReloadTest(SimulatorTest):
+    def context(self, sim, device_id, port=15020):
+        return sim.contexts[("tcp", ("127.0.0.1", port))][device_id]
+
+    def test_unchanged_device_keeps_its_context(self):
+        sim = self.simulator(device(1), device(2))
+        context = self.context(sim, 1)
+        self.write(device(1), device(2, tx_power_address=1010))
+        self.assertTrue(sim.reload_config())
+        self.assertIs(self.context(sim, 1), context)
+
+    def test_changed_device_keeps_unchanged_fields(self):
+        sim = self.simulator(device(1))
+        context = self.context(sim, 1)
+        context.setValues(3, 1000, FLOAT32.encode(-7.5))
+        self.write(device(1, tx_power_address=1010))
+        self.assertTrue(sim.reload_config())
+
+        new_context = self.context(sim, 1)
+        self.assertIsNot(new_context, context)
+        self.assertEqual(FLOAT32.decode(new_context.getValues(3, 1000, 2)), -7.5)
+
+    def test_add_and_remove(self):
+        sim = self.simulator(device(1), device(2))
+        self.write(device(1), device(3, port=15021))
+        self.assertTrue(sim.reload_config())
+        self.assertEqual({key[1] for key in sim.device_index}, {1, 3})
+        self.assertIn(("tcp", ("127.0.0.1", 15021)), sim.endpoints)
+        with self.assertRaises(NoSuchSlaveException):
+            self.context(sim, 2)
+        self.context(sim, 3, port=15021)
+
+    def test_invalid_file_keeps_the_configuration(self):
+        sim = self.simulator(device(1))
+        context = self.context(sim, 1)
+        for content in ("", "modbus_devices: [{device_id: 1, registers: 5}]", "a: ["):
+            with self.subTest(content=content):
+                with open(self.path, "w") as f:
+                    f.write(content)
+                with self.assertLogs("modbus_simulator", "ERROR"):
+                    self.assertFalse(sim.reload_config())
+                self.assertIs(self.context(sim, 1), context)
+                self.assertEqual(len(sim.register_map.devices), 1)
+
+
+class DeviceContextTest(SimulatorTest):
+    def test_devices_are_isolated(self):
+        for sparse in (False, True):
+            with self.subTest(sparse=sparse):
+                self.write(device(1), device(2))
+                sim = ModbusRTUSimulator(self.path, sparse=sparse)
+                first, second = (
+                    sim.device_context(device) for device in sim.register_map.devices
+                )
+                first.setValues(3, 1000, [1, 2])
+                self.assertNotEqual(second.getValues(3, 1000, 2), [1, 2])
+                for name in ("c", "d"):
+                    self.assertIsNot(first.store[name], second.store[name])
+                if not sparse:
+                    first.setValues(5, 10, [True])
+                    self.assertEqual(second.getValues(1, 10, 1), [0])
+
+
+class LazyTest(SimulatorTest):
+    def test_devices_are_activated_on_request(self):
+        self.write(device(1), device(2))
+        sim = ModbusRTUSimulator(self.path, lazy=True, max_active=1)
+        endpoint = ("tcp", ("127.0.0.1", 15020))
+        server_context = sim.contexts[endpoint]
+        self.assertEqual(server_context.active(), [])
+        self.assertEqual(sim.device_tasks, {})
+
+        first = server_context[1]
+        # Activation is handed to the thread running the updates
+        sim.scheduler.run_pending()
+        self.assertEqual(list(sim.device_tasks), [(endpoint, 1)])
+        self.assertIs(server_context[1], first)
+
+        server_context[2]
+        sim.scheduler.run_pending()
+        self.assertEqual(server_context.active(), [2])
+        self.assertEqual(list(sim.device_tasks), [(endpoint, 2)])
+
+
+class StartServerTest(SimulatorTest):
+    def test_start_from_another_thread(self):
+        sim = self.simulator(device(1))
+
+        async def serve():
+            pass
+
+        errors = []
+
+        def start():
+            try:
+                sim.start_server(use_asyncio=True)
+            except Exception as exc:
+                errors.append(exc)
+
+        handler = signal.getsignal(signal.SIGHUP) if hasattr(signal, "SIGHUP") else None
+        with mock.patch.object(sim, "serve_endpoints", serve):
+            thread = threading.Thread(target=start)
+            thread.start()
+            thread.join()
+        self.assertEqual(errors, [])
+        if handler is not None:
+            self.assertIs(signal.getsignal(signal.SIGHUP), handler)
+
+
+if __name__ == "__main__":
+    unittest.main()
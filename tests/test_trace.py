@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from modbus_codec import FLOAT32
+from modbus_read_planner import plan_reads
+from modbus_register_map import compile_device
+from modbus_trace import TraceRecorder, TraceReplayer
+
+
+BUS = ("tcp", ("127.0.0.1", 5020))
+
+
+class FakeContext:
+    """A slave context remembering the registers written to it"""
+
+    def __init__(self):
+        self.registers = {}
+
+    def setValues(self, fc_as_hex, address, values):
+        for offset, value in enumerate(values):
+            self.registers[address + offset] = value
+
+    def value(self, address):
+        return FLOAT32.decode([self.registers[address], self.registers[address + 1]])
+
+
+class TraceTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        device = compile_device(
+            {
+                "device_id": 1,
+                "transport": "tcp",
+                "server_address": "127.0.0.1:5020",
+                "registers": {
+                    "sfps": [
+                        {
+                            "sfp": 1,
+                            "rx_power": {"address": 1000, "datatype": "float32"},
+                            "tx_power": {"address": 1002, "datatype": "float32"},
+                        }
+                    ]
+                },
+            }
+        )
+        (self.block,) = plan_reads(device.fields)
+        self.now = 0.0
+
+    def record(self, recorder, timestamp, rx_power, tx_power):
+        registers = FLOAT32.encode(rx_power) + FLOAT32.encode(tx_power)
+        recorder.record(BUS, 1, self.block, registers, timestamp)
+
+    def replay(self, **kwargs):
+        replayer = TraceReplayer(self.path, clock=lambda: self.now, **kwargs)
+        context = FakeContext()
+        replayer.attach(BUS, 1, context)
+        return replayer, context
+
+    def test_round_trip(self):
+        recorder = TraceRecorder(self.path)
+        for second in range(3):
+            self.record(recorder, 100.0 + second, -second, second)
+        recorder.close()
+
+        replayer, context = self.replay(speed=2.0)
+        replayer.update()
+        self.assertEqual((context.value(1000), context.value(1002)), (0.0, 0.0))
+        self.now = 0.5
+        replayer.update()
+        self.assertEqual((context.value(1000), context.value(1002)), (-1.0, 1.0))
+        self.now = 10.0
+        replayer.update()
+        self.assertEqual((context.value(1000), context.value(1002)), (-2.0, 2.0))
+
+    def test_append_after_partial_record(self):
+        recorder = TraceRecorder(self.path)
+        self.record(recorder, 100.0, 1.0, 2.0)
+        recorder.close()
+        # An interrupted recording leaves half a record behind
+        column = os.path.join(self.path, "c0.bin")
+        with open(column, "ab") as f:
+            f.write(b"\0" * 5)
+
+        recorder = TraceRecorder(self.path)
+        with self.assertLogs("modbus_trace", "WARNING"):
+            self.record(recorder, 101.0, 3.0, 4.0)
+        recorder.close()
+
+        replayer, context = self.replay()
+        self.assertEqual([len(column) for column in replayer.columns], [2, 2])
+        replayer.update()
+        self.assertEqual((context.value(1000), context.value(1002)), (1.0, 2.0))
+        self.now = 1.0
+        replayer.update()
+        self.assertEqual((context.value(1000), context.value(1002)), (3.0, 4.0))
+
+
+if __name__ == "__main__":
+    unittest.main()